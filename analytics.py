@@ -0,0 +1,271 @@
+import json
+from bisect import bisect_left
+from datetime import date
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import case, event, extract, func, inspect, insert, select, update
+from database import upsert_add
+from models import db, Equipment, MaintenanceRecord, EquipmentCostRollup, WorkOrder, WorkOrderSlaDaily
+
+GROUP_COLUMNS = {"equipment_type": Equipment.equipment_type, "location": Equipment.location}
+
+def _record_totals():
+    """按设备汇总维修记录"""
+    return (select(MaintenanceRecord.equipment_id.label("equipment_id"),
+                   func.count(MaintenanceRecord.id).label("repairs"),
+                   func.sum(case((MaintenanceRecord.is_replaced, 1), else_=0)).label("replacements"),
+                   func.sum(MaintenanceRecord.repair_cost).label("total_cost"))
+            .group_by(MaintenanceRecord.equipment_id))
+
+def _rollup_totals():
+    """按设备汇总年度 rollup 表，行数为 设备数 × 年数"""
+    return (select(EquipmentCostRollup.equipment_id.label("equipment_id"),
+                   func.sum(EquipmentCostRollup.repairs).label("repairs"),
+                   func.sum(EquipmentCostRollup.replacements).label("replacements"),
+                   func.sum(EquipmentCostRollup.total_cost).label("total_cost"))
+            .group_by(EquipmentCostRollup.equipment_id))
+
+def equipment_costs(by="equipment_type", use_rollup=False):
+    """按设备类型或位置统计：设备数、平均使用年限、维修次数/费用、年均费用、年均维修次数、更换率"""
+    group = func.coalesce(GROUP_COLUMNS[by], "")
+    totals = (_rollup_totals() if use_rollup else _record_totals()).subquery()
+    rows = db.session.execute(
+        select(group.label("group"),
+               func.count(Equipment.id),
+               func.avg(Equipment.usage_years),
+               func.sum(Equipment.usage_years),
+               func.coalesce(func.sum(totals.c.repairs), 0),
+               func.coalesce(func.sum(totals.c.replacements), 0),
+               func.coalesce(func.sum(totals.c.total_cost), 0.0))
+        .outerjoin(totals, totals.c.equipment_id == Equipment.id)
+        .group_by(group)
+        .order_by(func.coalesce(func.sum(totals.c.total_cost), 0.0).desc())
+    )
+    result = []
+    for name, count, avg_age, equipment_years, repairs, replacements, cost in rows:
+        result.append({
+            "group": name, "equipment": count, "avg_age": avg_age,
+            "repairs": int(repairs), "replacements": int(replacements), "total_cost": float(cost),
+            # 每台设备每使用一年的费用与维修次数
+            "cost_per_year": float(cost) / equipment_years if equipment_years else None,
+            "repairs_per_year": int(repairs) / equipment_years if equipment_years else None,
+            "replacement_rate": int(replacements) / int(repairs) if repairs else None,
+        })
+    return result
+
+def yearly_costs(by="equipment_type", use_rollup=False, years=10):
+    """最近 years 个年份的维修费用：返回 (年份列表, 分组列表, {(年份, 分组): 费用})"""
+    group = func.coalesce(GROUP_COLUMNS[by], "")
+    if use_rollup:
+        year = EquipmentCostRollup.year
+        stmt = (select(year, group, func.sum(EquipmentCostRollup.total_cost))
+                .join(Equipment, EquipmentCostRollup.equipment_id == Equipment.id))
+    else:
+        year = extract("year", MaintenanceRecord.repair_date)
+        stmt = (select(year, group, func.sum(MaintenanceRecord.repair_cost))
+                .join(Equipment, MaintenanceRecord.equipment_id == Equipment.id))
+    cells = {}
+    for y, name, cost in db.session.execute(stmt.group_by(year, group)):
+        cells[(int(y), name)] = float(cost or 0)
+    year_list = sorted({y for y, _ in cells}, reverse=True)[:years]
+    groups = sorted({g for _, g in cells})
+    return year_list, groups, {k: v for k, v in cells.items() if k[0] in year_list}
+
+def rebuild_rollup():
+    """从维修记录全量重建 rollup 表"""
+    year = extract("year", MaintenanceRecord.repair_date)
+    db.session.execute(EquipmentCostRollup.__table__.delete())
+    db.session.execute(
+        EquipmentCostRollup.__table__.insert().from_select(
+            ["equipment_id", "year", "repairs", "replacements", "total_cost"],
+            select(MaintenanceRecord.equipment_id, year, func.count(MaintenanceRecord.id),
+                   func.sum(case((MaintenanceRecord.is_replaced, 1), else_=0)),
+                   func.coalesce(func.sum(MaintenanceRecord.repair_cost), 0.0))
+            .group_by(MaintenanceRecord.equipment_id, year)
+        )
+    )
+    db.session.commit()
+    return db.session.query(EquipmentCostRollup).count()
+
+# 增量维护：与维修记录的写入在同一事务内更新对应 (设备, 年份) 行
+def _apply(connection, equipment_id, repair_date, cost, replaced, sign):
+    if equipment_id is None or repair_date is None:
+        return
+    table = EquipmentCostRollup.__table__
+    delta = {"repairs": sign, "replacements": sign if replaced else 0, "total_cost": sign * (cost or 0.0)}
+    key = (table.c.equipment_id == equipment_id, table.c.year == repair_date.year)
+    if sign < 0:
+        connection.execute(update(table).where(*key).values({k: table.c[k] + v for k, v in delta.items()}))
+        # 该年份已无记录时删除，与全量重建结果一致
+        connection.execute(table.delete().where(*key, table.c.repairs <= 0))
+        return
+    upsert_add(connection, table, {"equipment_id": equipment_id, "year": repair_date.year}, delta)
+
+_FIELDS = ("equipment_id", "repair_date", "repair_cost", "is_replaced")
+
+def _previous(target, fields=_FIELDS):
+    """flush 前的旧值"""
+    state = inspect(target)
+    values = []
+    for name in fields:
+        history = state.attrs[name].history
+        values.append(history.deleted[0] if history.deleted else getattr(target, name))
+    return values
+
+@event.listens_for(MaintenanceRecord, "after_insert")
+def _record_inserted(mapper, connection, target):
+    _apply(connection, *(getattr(target, name) for name in _FIELDS), 1)
+
+@event.listens_for(MaintenanceRecord, "after_update")
+def _record_updated(mapper, connection, target):
+    state = inspect(target)
+    if not any(state.attrs[name].history.has_changes() for name in _FIELDS):
+        return
+    _apply(connection, *_previous(target), -1)
+    _apply(connection, *(getattr(target, name) for name in _FIELDS), 1)
+
+@event.listens_for(MaintenanceRecord, "after_delete")
+def _record_deleted(mapper, connection, target):
+    _apply(connection, *_previous(target), -1)
+
+# 工单 SLA：响应时长 = 派单 - 创建，解决时长 = 完成 - 创建，单位小时
+# 日汇总只存分桶计数，分位数由合并后的直方图插值得到，多天、多维度可直接相加
+SLA_BUCKETS = [0.5, 1, 2, 4, 8, 12, 24, 48, 72, 120, 168, 336]   # 各桶上界，最后一桶为 >336
+DONE_STATUSES = ("已完成", "已关闭")
+SLA_DIMENSIONS = ("repairer", "type", "priority")
+_SLA_FIELDS = ("status", "created_at", "assigned_at", "completed_at", "repairer", "type", "priority", "satisfaction")
+
+def _bucket(hours):
+    return bisect_left(SLA_BUCKETS, max(hours, 0))
+
+def _hours(start, end):
+    return (end - start).total_seconds() / 3600 if start and end else None
+
+def percentile(hist, pct):
+    """由分桶计数估算分位数（桶内线性插值），无数据返回 None"""
+    total = sum(hist)
+    if not total:
+        return None
+    target = total * pct / 100
+    seen = 0
+    for i, n in enumerate(hist):
+        if n and seen + n >= target:
+            if i == len(SLA_BUCKETS):
+                return SLA_BUCKETS[-1]
+            low = SLA_BUCKETS[i - 1] if i else 0
+            return low + (SLA_BUCKETS[i] - low) * (target - seen) / n
+        seen += n
+    return SLA_BUCKETS[-1]
+
+def _sla_contribution(status, created_at, assigned_at, completed_at, repairer, type, priority, satisfaction):
+    """一张工单对日汇总的贡献；未完成的工单不计入"""
+    if status not in DONE_STATUSES or completed_at is None or created_at is None:
+        return None
+    key = (completed_at.date(), repairer or "", type or "", priority or "")
+    response = _hours(created_at, assigned_at)
+    return key, (None if response is None else _bucket(response)), _bucket(_hours(created_at, completed_at)), satisfaction
+
+def _empty_hist():
+    return [0] * (len(SLA_BUCKETS) + 1)
+
+def _sla_apply(connection, contribution, sign):
+    if contribution is None:
+        return
+    (day, repairer, type_, priority), response, resolution, satisfaction = contribution
+    table = WorkOrderSlaDaily.__table__
+    key = (table.c.day == day, table.c.repairer == repairer, table.c.type == type_, table.c.priority == priority)
+    # 直方图是 JSON，读改写期间锁住该行（SQLite 写事务本身串行）
+    row = connection.execute(select(table).where(*key).with_for_update()).mappings().first()
+    values = {"completed": 0, "satisfied": 0, "dissatisfied": 0}
+    response_hist, resolution_hist = _empty_hist(), _empty_hist()
+    if row:
+        values = {k: row[k] or 0 for k in values}
+        response_hist = json.loads(row["response_hist"] or "null") or response_hist
+        resolution_hist = json.loads(row["resolution_hist"] or "null") or resolution_hist
+    values["completed"] += sign
+    if satisfaction == "满意":
+        values["satisfied"] += sign
+    elif satisfaction == "不满意":
+        values["dissatisfied"] += sign
+    if response is not None:
+        response_hist[response] += sign
+    resolution_hist[resolution] += sign
+    values.update(response_hist=json.dumps(response_hist), resolution_hist=json.dumps(resolution_hist))
+    if row and values["completed"] <= 0:
+        connection.execute(table.delete().where(*key))
+    elif row:
+        connection.execute(update(table).where(*key).values(**values))
+    elif sign > 0:
+        connection.execute(insert(table).values(day=day, repairer=repairer, type=type_, priority=priority, **values))
+
+@event.listens_for(WorkOrder, "after_insert")
+def _workorder_inserted(mapper, connection, target):
+    _sla_apply(connection, _sla_contribution(*(getattr(target, name) for name in _SLA_FIELDS)), 1)
+
+@event.listens_for(WorkOrder, "after_update")
+def _workorder_updated(mapper, connection, target):
+    old = _sla_contribution(*_previous(target, _SLA_FIELDS))
+    new = _sla_contribution(*(getattr(target, name) for name in _SLA_FIELDS))
+    if old != new:
+        _sla_apply(connection, old, -1)
+        _sla_apply(connection, new, 1)
+
+@event.listens_for(WorkOrder, "after_delete")
+def _workorder_deleted(mapper, connection, target):
+    _sla_apply(connection, _sla_contribution(*_previous(target, _SLA_FIELDS)), -1)
+
+def rebuild_sla_rollup():
+    """从工单全量重建 SLA 日汇总"""
+    rows = {}
+    done = (db.session.query(*[getattr(WorkOrder, name) for name in _SLA_FIELDS])
+            .filter(WorkOrder.status.in_(DONE_STATUSES), WorkOrder.completed_at.isnot(None)))
+    for values in done.yield_per(2000):
+        contribution = _sla_contribution(*values)
+        if contribution is None:
+            continue
+        key, response, resolution, satisfaction = contribution
+        row = rows.setdefault(key, {"completed": 0, "satisfied": 0, "dissatisfied": 0,
+                                    "response_hist": _empty_hist(), "resolution_hist": _empty_hist()})
+        row["completed"] += 1
+        row["satisfied"] += satisfaction == "满意"
+        row["dissatisfied"] += satisfaction == "不满意"
+        if response is not None:
+            row["response_hist"][response] += 1
+        row["resolution_hist"][resolution] += 1
+    db.session.execute(WorkOrderSlaDaily.__table__.delete())
+    records = [dict(row, day=day, repairer=repairer, type=type_, priority=priority,
+                    response_hist=json.dumps(row["response_hist"]), resolution_hist=json.dumps(row["resolution_hist"]))
+               for (day, repairer, type_, priority), row in rows.items()]
+    for start in range(0, len(records), 2000):
+        db.session.execute(insert(WorkOrderSlaDaily), records[start:start + 2000])
+    db.session.commit()
+    return len(records)
+
+def sla_report(by="repairer", months=6, today=None):
+    """最近 months 个月按月、按维度合并日汇总：完成数、响应/解决时长 p50/p90、满意率"""
+    today = today or date.today()
+    start = today.replace(day=1) - relativedelta(months=months - 1)
+    dimension = getattr(WorkOrderSlaDaily, by)
+    merged = {}
+    rows = (db.session.query(WorkOrderSlaDaily.day, dimension, WorkOrderSlaDaily.completed, WorkOrderSlaDaily.satisfied,
+                             WorkOrderSlaDaily.dissatisfied, WorkOrderSlaDaily.response_hist, WorkOrderSlaDaily.resolution_hist)
+            .filter(WorkOrderSlaDaily.day >= start))
+    for day, group, completed, satisfied, dissatisfied, response_hist, resolution_hist in rows:
+        m = merged.setdefault((day.strftime("%Y-%m"), group), {
+            "completed": 0, "satisfied": 0, "dissatisfied": 0, "response": _empty_hist(), "resolution": _empty_hist()})
+        m["completed"] += completed
+        m["satisfied"] += satisfied
+        m["dissatisfied"] += dissatisfied
+        for name, hist in (("response", response_hist), ("resolution", resolution_hist)):
+            for i, n in enumerate(json.loads(hist or "[]")):
+                m[name][i] += n
+    report = []
+    ordered = sorted(sorted(merged.items(), key=lambda item: item[0][1]), key=lambda item: item[0][0], reverse=True)
+    for (month, group), m in ordered:
+        rated = m["satisfied"] + m["dissatisfied"]
+        report.append({
+            "month": month, "group": group, "completed": m["completed"],
+            "response_p50": percentile(m["response"], 50), "response_p90": percentile(m["response"], 90),
+            "resolution_p50": percentile(m["resolution"], 50), "resolution_p90": percentile(m["resolution"], 90),
+            "rated": rated, "satisfaction_rate": m["satisfied"] / rated if rated else None,
+        })
+    return report
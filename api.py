@@ -0,0 +1,84 @@
+import hashlib
+from datetime import datetime, date, timezone
+from flask import Response, request, jsonify
+from sqlalchemy import func
+from pagination import keyset_paginate
+
+def _iso(value):
+    return value.isoformat() if isinstance(value, (datetime, date)) else value
+
+def announcement_json(a):
+    return {"id": a.id, "title": a.title, "content": a.content, "created_at": _iso(a.created_at)}
+
+def workorder_json(w):
+    return {
+        "id": w.id, "type": w.type, "status": w.status, "priority": w.priority, "description": w.description,
+        "owner_id": w.owner_id, "equipment_id": w.equipment_id, "assignee": w.assignee, "repairer": w.repairer,
+        "satisfaction": w.satisfaction, "created_at": _iso(w.created_at), "assigned_at": _iso(w.assigned_at),
+        "completed_at": _iso(w.completed_at), "closed_at": _iso(w.closed_at), "updated_at": _iso(w.updated_at),
+    }
+
+def invoice_json(i):
+    return {
+        "id": i.id, "owner_id": i.owner_id, "charge_type_id": i.charge_type_id,
+        "name": i.charge_type.name if i.charge_type else i.description, "description": i.description,
+        "billing_cycle": i.billing_cycle, "period": i.period, "quantity": i.quantity, "price": i.price,
+        "amount": i.amount, "unpaid_amount": i.unpaid_amount, "due_date": _iso(i.due_date), "status": i.status,
+        "updated_at": _iso(i.updated_at),
+    }
+
+def parse_since(value):
+    """?since= 接受 ISO 时间（UTC），如 2026-10-18T08:00:00"""
+    since = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if since.tzinfo:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return since
+
+def _http_last_modified(last_modified):
+    """HTTP 日期只精确到秒：最后修改所在的这一秒还没过完时不发 Last-Modified，
+    否则同一秒内稍后的写入与它截断后相同，会被 If-Modified-Since 误判为未修改"""
+    if last_modified is None:
+        return None
+    second = last_modified.replace(microsecond=0)
+    if second >= datetime.utcnow().replace(microsecond=0):
+        return None
+    return second.replace(tzinfo=timezone.utc)
+
+def _not_modified(etag, last_modified):
+    # 同时带两个条件头时只看 ETag
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        # 能发出的 Last-Modified 所在秒已结束，之后的写入都落在更晚的秒
+        return last_modified <= request.if_modified_since
+    return False
+
+def conditional_list(query, version, order, serialize, desc=True, options=()):
+    """列表 JSON：先用一条聚合查询算出 ETag / Last-Modified，命中则直接 304，不查询、不序列化行；
+    ?since= 只返回 version 列晚于该时间的行，按 (version, id) 升序分页"""
+    id_col = order[-1]
+    since = request.args.get("since")
+    if since:
+        try:
+            query = query.filter(version > parse_since(since))
+        except ValueError:
+            return jsonify(error="since 应为 ISO 时间，如 2026-10-18T08:00:00"), 400
+    count, last_modified, max_id = query.with_entities(func.count(id_col), func.max(version), func.max(id_col)).one()
+    # 行数覆盖删除，最大版本覆盖修改，查询串区分筛选条件和分页
+    etag = hashlib.sha1(f"{count}:{_iso(last_modified)}:{max_id}:{request.full_path}".encode()).hexdigest()
+
+    http_last_modified = _http_last_modified(last_modified)
+    if _not_modified(etag, http_last_modified):
+        response = Response(status=304)
+    else:
+        if since:
+            page = keyset_paginate(query.options(*options), [version, id_col])
+        else:
+            page = keyset_paginate(query.options(*options), order, desc=desc)
+        response = jsonify(items=[serialize(row) for row in page.items], next_cursor=page.next_cursor,
+                           last_modified=_iso(last_modified))
+    response.set_etag(etag, weak=True)
+    if http_last_modified:
+        response.last_modified = http_last_modified
+    response.cache_control.no_cache = True   # 客户端每次带条件头重新验证
+    return response
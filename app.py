@@ -1,12 +1,58 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+import csv
+import hmac
+import uuid
+import click
+from flask import Flask, Response, jsonify, render_template, request, redirect, url_for, flash, session, stream_with_context
 from config import Config
-from models import db, Owner, ChargeType, Invoice, Payment, Equipment, MaintenancePlan, WorkOrder, Announcement, MaintenanceRecord
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import contains_eager, joinedload, raiseload
+from models import db, Owner, OwnerAccount, ChargeType, Invoice, Payment, Equipment, MaintenancePlan, WorkOrder, Announcement, MaintenanceRecord
+from billing import PAID_EPSILON, UNPAID_STATUSES, paid_totals, generate_invoices, mark_overdue, post_payment, post_payments
+from ledger import reconcile_accounts
+from reports import REPORT_DIMENSIONS, collection_report, rebuild_reports
+import jobs
+from mailer import enqueue_announcement, delivery_counts, deliver_pending
+from maintenance import run_due_plans, forecast
+from analytics import GROUP_COLUMNS, SLA_DIMENSIONS, equipment_costs, yearly_costs, rebuild_rollup, sla_report, rebuild_sla_rollup
+from pagination import keyset_paginate, page_url
+import querybudget
+import database
+import metrics
+import migrations
+from database import read_only
+import api
+from search import search_filter, create_search_index, rebuild_search_index, reset_search_cache
+from cache import cache
+from importer import iter_rows, import_owners
+from parking import parse_vehicles, sync_owners, migrate_all, lookup
+from exports import invoice_export, payment_export, workorder_export, stream_csv
 from datetime import datetime, date
 from dateutil.relativedelta import relativedelta
 
 app = Flask(__name__)
 app.config.from_object(Config)
 db.init_app(app)
+app.add_template_global(page_url)
+querybudget.init_app(app)
+database.init_app(app)
+metrics.init_app(app)
+cache.init_app(app)
+
+# 首页统计随相关表的写入失效
+cache.depends_on('dashboard:owners', Owner)
+cache.depends_on('dashboard:unpaid', Invoice)
+cache.depends_on('dashboard:overdue', Invoice)
+cache.depends_on('dashboard:open_wos', WorkOrder)
+cache.depends_on('dashboard:equips', Equipment)
+cache.depends_on('dashboard:latest_ann', Announcement)
+cache.depends_on('dashboard:recent_wos', WorkOrder)
+
+if app.config['OVERDUE_SWEEP_INTERVAL']:
+    jobs.start_periodic(app, 'overdue-sweep', app.config['OVERDUE_SWEEP_INTERVAL'], mark_overdue)
+if app.config['MAIL_WORKER_INTERVAL'] and app.config['MAIL_SERVER']:
+    jobs.start_periodic(app, 'mail-worker', app.config['MAIL_WORKER_INTERVAL'], lambda: deliver_pending(app.config))
+if app.config['MAINTENANCE_SCHEDULER_INTERVAL']:
+    jobs.start_periodic(app, 'maintenance-scheduler', app.config['MAINTENANCE_SCHEDULER_INTERVAL'], run_due_plans)
 
 # language
 @app.before_request
@@ -20,11 +66,23 @@ def render_view(template_name, **kwargs):
     tpl = f"en/{template_name}" if session.get('lang') == 'en' else template_name
     return render_template(tpl, **kwargs)
 
+def csv_export(name, build, back):
+    try:
+        columns, stmt = build(request.args.get('status'), request.args.get('start'), request.args.get('end'))
+    except ValueError:
+        flash('日期格式应为 YYYY-MM-DD', 'danger')
+        return redirect(url_for(back))
+    body = stream_with_context(stream_csv(columns, stmt, session.get('lang')))
+    filename = f"{name}-{date.today():%Y%m%d}.csv"
+    return Response(body, mimetype='text/csv', headers={'Content-Disposition': f'attachment; filename={filename}'})
+
 @app.cli.command("init-db")
 def init_db():
     with app.app_context():
         db.drop_all()
+        reset_search_cache()
         db.create_all()
+        migrations.stamp()
         
         # 业主数据 - 包含完整的房产和车辆信息
         o1 = Owner(
@@ -34,7 +92,6 @@ def init_db():
             unit="A-2-302",
             area=120.5,
             unit_type="三室两厅",
-            vehicle_count=2,
             parking_spots="P-001,P-002",
             vehicles='[{"plate":"沪A12345","model":"Tesla 3"},{"plate":"沪B67890","model":"BMW X5"}]'
         )
@@ -45,7 +102,6 @@ def init_db():
             unit="B-1-101",
             area=85.0,
             unit_type="两室一厅",
-            vehicle_count=1,
             parking_spots="P-003",
             vehicles='[{"plate":"沪C11111","model":"Toyota Camry"}]'
         )
@@ -56,7 +112,6 @@ def init_db():
             unit="C-3-501",
             area=150.0,
             unit_type="四室及以上",
-            vehicle_count=3,
             parking_spots="P-004,P-005,P-006",
             vehicles='[{"plate":"沪D22222","model":"Mercedes E300"},{"plate":"沪E33333","model":"Audi A6"},{"plate":"沪F44444","model":"Volkswagen Passat"}]'
         )
@@ -66,6 +121,8 @@ def init_db():
         ct2 = ChargeType(name="停车费", billing_cycle="月", unit="月", price=300, link_to="vehicles", description="300元/月·辆")
         db.session.add_all([o1, o2, o3, ct1, ct2])
         db.session.commit()
+        sync_owners([o1.id, o2.id, o3.id])
+        db.session.commit()
 
         # 设备数据 - 包含电梯、空调、水管、燃气
         eq1 = Equipment(name="1号电梯", equipment_type="电梯", location="A座", serial="EL-001", status="正常", install_date=date(2020, 1, 15))
@@ -74,59 +131,270 @@ def init_db():
         eq4 = Equipment(name="主水管", equipment_type="水管", location="地下层", serial="WP-001", status="正常", install_date=date(2018, 3, 10))
         eq5 = Equipment(name="燃气管道", equipment_type="燃气", location="全小区", serial="GAS-001", status="正常", install_date=date(2018, 3, 10))
         
-        # 计算使用时间
-        for eq in [eq1, eq2, eq3, eq4, eq5]:
-            if eq.install_date:
-                eq.usage_years = (date.today() - eq.install_date).days / 365.25
-        
         plan = MaintenancePlan(equipment=eq1, frequency="每季度", next_date=date.today()+relativedelta(months=3))
         ann = Announcement(title="停水通知", content="本周三9:00-12:00小区停水，请提前蓄水。")
         db.session.add_all([eq1, eq2, eq3, eq4, eq5, plan, ann])
         db.session.commit()
+        rebuild_search_index()
         print("数据库已初始化")
 
+@app.cli.command("upgrade-db")
+def upgrade_db_command():
+    # 已有数据库补表、补列、补索引，不清空数据
+    try:
+        applied = migrations.upgrade()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    for number, name in applied:
+        print(f"已执行迁移 {number}：{name}")
+    if not applied:
+        print("数据库已是最新版本")
+    # 搜索索引不属于模型，单独建立；新建或换分词器的索引表会从现有数据回填
+    if create_search_index():
+        print("搜索索引已就绪")
+
+@app.cli.command("mark-overdue")
+def mark_overdue_command():
+    print(f"已标记 {mark_overdue()} 张逾期账单")
+
+@app.cli.command("send-emails")
+@click.option("--max", "max_rows", type=int, default=None, help="本次最多发送的收件人数")
+def send_emails_command(max_rows):
+    try:
+        stats = deliver_pending(app.config, max_rows)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    print(f"已发送 {stats['sent']}，失败 {stats['failed']}，共 {stats['messages']} 封邮件")
+
+@app.cli.command("post-payments")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+def post_payments_command(path):
+    """银行对账 CSV：owner_id, invoice_id, amount, method, note, idempotency_key"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        results = post_payments(csv.DictReader(f))
+    for r in results:
+        if r['status'] == 'error':
+            print(f"第 {r['index'] + 2} 行：{r['error']}")
+    print(f"新建 {sum(r['status'] == 'created' for r in results)}，"
+          f"重复 {sum(r['status'] == 'duplicate' for r in results)}，"
+          f"错误 {sum(r['status'] == 'error' for r in results)}")
+
+@app.cli.command("schedule-maintenance")
+@click.option("--dry-run", is_flag=True, help="只预测未来每月的保养工单数量，不写库")
+@click.option("--months", default=12, show_default=True, help="预测的月数")
+def schedule_maintenance_command(dry_run, months):
+    if dry_run:
+        for month, total, by_type in forecast(months):
+            detail = "，".join(f"{t} {n}" for t, n in sorted(by_type.items()))
+            print(f"{month}  {total:5d}  {detail}")
+        return
+    stats = run_due_plans()
+    if stats['locked']:
+        print("其他进程正在执行排程，已跳过")
+        return
+    print(f"到期计划 {stats['due']} 个，新建工单 {stats['created']} 张")
+    if stats['skipped']:
+        print("无法识别频率的计划：" + "、".join(f"#{i}" for i in stats['skipped']))
+
+@app.cli.command("seed-bench")
+@click.option("--owners", default=1000, show_default=True, help="业主数量")
+@click.option("--months", default=12, show_default=True, help="生成最近几个月的账单")
+@click.option("--seed", "random_seed", default=0, help="随机种子")
+def seed_bench_command(owners, months, random_seed):
+    import bench
+    stats = bench.seed(owners, months, random_seed)
+    print("压测数据已生成：" + "，".join(f"{k} {v}" for k, v in stats.items()))
+
+@app.cli.command("bench")
+@click.option("--iterations", default=20, show_default=True, help="每个路由请求次数")
+@click.option("--output", default="bench.json", show_default=True, help="结果 JSON 文件")
+def bench_command(iterations, output):
+    import bench, json
+    report = bench.benchmark_report(app, iterations)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"{'route':40} {'p50':>8} {'p95':>8} {'p99':>8} {'sql':>5} {'peak KB':>9}")
+    for path, r in report["routes"].items():
+        print(f"{path:40} {r['p50_ms']:8.2f} {r['p95_ms']:8.2f} {r['p99_ms']:8.2f} {r['sql_statements']:5d} {r['peak_memory_kb']:9.1f}")
+    print(f"结果已保存到 {output}")
+
+@app.cli.command("explain-check")
+def explain_check_command():
+    # 先用 seed-bench 生成数据；任何路由的查询出现整表扫描时以非零状态退出
+    import bench
+    scans = bench.explain_routes(app)
+    for path, table, statement in scans:
+        print(f"{path}  全表扫描 {table}：{statement[:200]}")
+    if scans:
+        raise click.ClickException(f"{len(scans)} 条查询未使用索引")
+    print("所有路由的查询都使用了索引")
+
+@app.cli.command("bench-throughput")
+@click.option("--url", default="http://127.0.0.1:8000", help="运行中的服务地址，如 WEB_CONCURRENCY=4 gunicorn app:app")
+@click.option("--concurrency", default=16, type=int)
+@click.option("--duration", default=10, type=int, help="秒")
+@click.option("--write-ratio", default=0.2, type=float, help="写请求（新建工单）占比")
+def bench_throughput_command(url, concurrency, duration, write_ratio):
+    import bench, json
+    report = bench.run_throughput(url.rstrip('/'), concurrency, duration, write_ratio)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+@app.cli.command("import-owners")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--batch-size", default=1000, show_default=True, help="每个事务写入的行数")
+def import_owners_command(path, batch_size):
+    with open(path, "rb") as f:
+        try:
+            report = import_owners(iter_rows(f, path), batch_size=batch_size)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    for err in report["errors"]:
+        print(f"第 {err['row']} 行 {err['unit'] or ''}：" + "；".join(err["errors"]))
+    print(f"共 {report['rows']} 行：新建 {report['created']}，更新 {report['updated']}，"
+          f"错误 {len(report['errors'])}，耗时 {report['seconds']:.2f}s")
+
+@app.cli.command("rebuild-search-index")
+def rebuild_search_index_command():
+    counts = rebuild_search_index()
+    print("搜索索引已重建：" + "，".join(f"{t} {n} 条" for t, n in counts.items()))
+
+@app.cli.command("rebuild-equipment-rollup")
+def rebuild_equipment_rollup_command():
+    with app.app_context():
+        print(f"设备维修汇总已重建：{rebuild_rollup()} 行")
+
+@app.cli.command("rebuild-sla-rollup")
+def rebuild_sla_rollup_command():
+    with app.app_context():
+        print(f"工单 SLA 日汇总已重建：{rebuild_sla_rollup()} 行")
+
+@app.cli.command("reconcile-accounts")
+def reconcile_accounts_command():
+    with app.app_context():
+        stats = reconcile_accounts()
+        print(f"业主账户已重建：{stats['accounts']} 个，其中 {stats['mismatched']} 个与增量结果不一致")
+
+@app.cli.command("rebuild-reports")
+def rebuild_reports_command():
+    with app.app_context():
+        stats = rebuild_reports()
+        print(f"收缴期间汇总已重建：{stats['rows']} 行，其中 {stats['mismatched']} 行与增量结果不一致")
+
+@app.cli.command("migrate-vehicles")
+def migrate_vehicles_command():
+    with app.app_context():
+        stats = migrate_all()
+        print(f"已转换 {stats['owners']} 个业主：车辆 {stats['vehicles']}，车位 {stats['spots']}")
+        for owner_id, key in stats['conflicts']:
+            print(f"  重复登记，已跳过：业主 #{owner_id} {key}")
+        for owner_id in stats['invalid']:
+            print(f"  车辆 JSON 无法解析：业主 #{owner_id}")
+
+@app.cli.command("generate-invoices")
+@click.option("--period", required=True, help="账期，格式 YYYY-MM")
+@click.option("--chunk-size", default=1000, show_default=True, help="每批处理的业主数")
+def generate_invoices_command(period, chunk_size):
+    try:
+        stats = generate_invoices(period, chunk_size=chunk_size)
+    except ValueError:
+        raise click.BadParameter("格式应为 YYYY-MM", param_hint="--period")
+    print(f"账期 {stats['period']}：生成 {stats['created']} 张账单，"
+          f"{stats['charge_types']} 个收费项目，耗时 {stats['seconds']:.2f}s，{stats['rows_per_sec']:.0f} 行/秒")
+    if stats['skipped_types']:
+        print("本期不出账：" + "、".join(stats['skipped_types']))
+
+def overdue_count():
+    return cache.get_or_set('dashboard:overdue', lambda: Invoice.query.filter_by(status="逾期").count())
+
 @app.route('/')
 def dashboard():
-    owners = Owner.query.count()
-    unpaid = Invoice.query.filter(Invoice.status!="已支付").count()
-    open_wos = WorkOrder.query.filter(WorkOrder.status!="已完成").count()
-    equips = Equipment.query.count()
-    latest_ann = Announcement.query.order_by(Announcement.created_at.desc()).limit(5).all()
-    recent_wos = WorkOrder.query.order_by(WorkOrder.created_at.desc()).limit(8).all()
+    owners = cache.get_or_set('dashboard:owners', lambda: Owner.query.count())
+    unpaid = cache.get_or_set('dashboard:unpaid', lambda: Invoice.query.filter(Invoice.status.in_(UNPAID_STATUSES)).count())
+    overdue = overdue_count()
+    open_wos = cache.get_or_set('dashboard:open_wos', lambda: WorkOrder.query.filter(WorkOrder.status!="已完成").count())
+    equips = cache.get_or_set('dashboard:equips', lambda: Equipment.query.count())
+    # 列表只缓存模板用到的字段，不缓存 ORM 对象
+    latest_ann = cache.get_or_set('dashboard:latest_ann', lambda: [
+        dict(title=a.title, content=a.content, created_at=a.created_at)
+        for a in Announcement.query.order_by(Announcement.created_at.desc()).limit(5)
+    ])
+    recent_wos = cache.get_or_set('dashboard:recent_wos', lambda: [
+        dict(type=w.type, description=w.description, created_at=w.created_at)
+        for w in WorkOrder.query.order_by(WorkOrder.created_at.desc()).limit(8)
+    ])
     move_outs = Owner.query.order_by(Owner.created_at.desc()).limit(10).all()   # placeholder
-    return render_view('dashboard.html', owners=owners, unpaid=unpaid, open_wos=open_wos, equips=equips, latest_ann=latest_ann, recent_wos=recent_wos, move_outs=move_outs)
+    return render_view('dashboard.html', owners=owners, unpaid=unpaid, overdue=overdue, open_wos=open_wos, equips=equips, latest_ann=latest_ann, recent_wos=recent_wos, move_outs=move_outs)
 
 @app.route('/owners')
+@read_only
 def owners_list():
     q = request.args.get('q','').strip()
+    sort = request.args.get('sort', '')
     query = Owner.query
     if q:
-        like = f"%{q}%"
-        query = query.filter((Owner.name.like(like)) | (Owner.phone.like(like)) | (Owner.unit.like(like)))
-    owners = query.order_by(Owner.id.desc()).all()
-    return render_view('owners/list.html', owners=owners, q=q)
+        query = query.filter(search_filter(Owner, q))
+    if sort == 'arrears':
+        # 只列出欠费业主，按欠费金额从高到低
+        query = (query.join(OwnerAccount, OwnerAccount.owner_id == Owner.id)
+                 .options(contains_eager(Owner.account))
+                 .filter(OwnerAccount.balance > PAID_EPSILON))
+        page = keyset_paginate(query, [OwnerAccount.balance, Owner.id], desc=True)
+    else:
+        page = keyset_paginate(query.options(joinedload(Owner.account)), [Owner.id], desc=True)
+    return render_view('owners/list.html', owners=page.items, page=page, q=q, sort=sort)
+
+def flash_conflicts(conflicts):
+    if conflicts:
+        flash('以下车牌/车位已登记在其他业主名下，未保存：' + '、'.join(k for _, k in conflicts), 'warning')
 
 @app.route('/owners/new', methods=['GET','POST'])
 def owners_new():
     if request.method == 'POST':
         vehicles = request.form.get('vehicles_json') or "[]"
+        try:
+            parse_vehicles(vehicles)
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return render_view('owners/new.html')
         owner = Owner(
             name=request.form['name'],
             phone=request.form.get('phone'),
             email=request.form.get('email'),
-            unit=request.form.get('unit'),
+            unit=(request.form.get('unit') or '').strip() or None,
             area=float(request.form.get('area') or 0),
             unit_type=request.form.get('unit_type'),
             vehicles=vehicles,
-            vehicle_count=int(request.form.get('vehicle_count') or 0),
             parking_spots=request.form.get('parking_spots')
         )
         db.session.add(owner)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            flash(f'房产 {owner.unit} 已登记给其他业主', 'danger')
+            return render_view('owners/new.html')
+        conflicts = sync_owners([owner.id])['conflicts']
         db.session.commit()
+        flash_conflicts(conflicts)
         flash('已创建业主', 'success')
         return redirect(url_for('owners_list'))
     return render_view('owners/new.html')
 
+@app.route('/owners/import', methods=['GET','POST'])
+def owners_import():
+    report = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('请选择文件', 'danger')
+            return redirect(url_for('owners_import'))
+        try:
+            report = import_owners(iter_rows(upload.stream, upload.filename))
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('owners_import'))
+    return render_view('owners/import.html', report=report)
+
 @app.route('/owners/<int:oid>', methods=['GET','POST'])
 def owners_detail(oid):
     owner = Owner.query.get_or_404(oid)
@@ -134,19 +402,45 @@ def owners_detail(oid):
         owner.name = request.form['name']
         owner.phone = request.form.get('phone')
         owner.email = request.form.get('email')
-        owner.unit = request.form.get('unit')
+        owner.unit = (request.form.get('unit') or '').strip() or None
         owner.area = float(request.form.get('area') or 0)
         owner.unit_type = request.form.get('unit_type')
         owner.vehicles = request.form.get('vehicles_json') or "[]"
-        owner.vehicle_count = int(request.form.get('vehicle_count') or 0)
         owner.parking_spots = request.form.get('parking_spots')
+        try:
+            parse_vehicles(owner.vehicles)
+        except ValueError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+            return redirect(url_for('owners_detail', oid=oid))
+        unit = owner.unit
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            flash(f'房产 {unit} 已登记给其他业主', 'danger')
+            return redirect(url_for('owners_detail', oid=oid))
+        conflicts = sync_owners([oid])['conflicts']
         db.session.commit()
+        flash_conflicts(conflicts)
         flash('已保存', 'success')
         return redirect(url_for('owners_detail', oid=oid))
-    invoices = Invoice.query.filter_by(owner_id=oid).all()
-    payments = Payment.query.filter_by(owner_id=oid).all()
-    wos = WorkOrder.query.filter_by(owner_id=oid).all()
-    return render_view('owners/detail.html', owner=owner, invoices=invoices, payments=payments, wos=wos)
+    # 只展示最近的记录，余额取自业主账户
+    invoices = (Invoice.query.options(joinedload(Invoice.charge_type)).filter_by(owner_id=oid)
+                .order_by(Invoice.due_date.desc(), Invoice.id.desc()).limit(50).all())
+    wos = WorkOrder.query.filter_by(owner_id=oid).order_by(WorkOrder.created_at.desc()).limit(50).all()
+    return render_view('owners/detail.html', owner=owner, account=owner.account, invoices=invoices, wos=wos)
+
+@app.route('/api/gate/lookup')
+def gate_lookup():
+    """门岗查询：?plate=沪A12345 或 ?spot=P-004"""
+    plate, spot = request.args.get('plate', '').strip(), request.args.get('spot', '').strip()
+    if not plate and not spot:
+        return jsonify(error='请提供 plate 或 spot 参数'), 400
+    result = lookup(plate=plate, spot=spot)
+    if result is None:
+        return jsonify(error='未找到'), 404
+    return jsonify(result)
 
 @app.route('/owners/<int:oid>/delete', methods=['POST'])
 def owners_delete(oid):
@@ -178,21 +472,34 @@ def charge_types_new():
     return render_view('billing/charge_types_new.html')
 
 @app.route('/billing/invoices')
+@read_only
 def invoices_list():
     q = request.args.get('q','').strip()
     status = request.args.get('status','')
-    query = Invoice.query
+    query = Invoice.query.options(joinedload(Invoice.owner), joinedload(Invoice.charge_type))
     if status:
         query = query.filter_by(status=status)
-    invoices = query.order_by(Invoice.due_date.asc()).all()
+    page = keyset_paginate(query, [Invoice.due_date, Invoice.id])
+    invoices = page.items
     
-    # 为每个账单计算已缴费金额
-    invoice_paid = {}
-    for inv in invoices:
-        paid = sum([p.amount for p in Payment.query.filter_by(invoice_id=inv.id).all()])
-        invoice_paid[inv.id] = paid
+    # 汇总当前页账单的已缴费金额
+    invoice_paid = paid_totals(inv.id for inv in invoices)
     
-    return render_view('billing/invoices.html', invoices=invoices, q=q, status=status, invoice_paid=invoice_paid)
+    return render_view('billing/invoices.html', invoices=invoices, page=page, q=q, status=status, invoice_paid=invoice_paid, overdue=overdue_count())
+
+@app.route('/billing/reports')
+@read_only
+def billing_reports():
+    by = request.args.get('by', '')
+    if by not in REPORT_DIMENSIONS:
+        by = ''
+    months = min(max(request.args.get('months', 12, type=int), 1), 60)
+    return render_view('billing/reports.html', rows=collection_report(by or None, months), by=by, months=months)
+
+@app.route('/billing/invoices/export')
+@read_only
+def invoices_export():
+    return csv_export('invoices', invoice_export, 'invoices_list')
 
 @app.route('/billing/invoices/new', methods=['GET','POST'])
 def invoices_new():
@@ -230,78 +537,133 @@ def invoices_new():
         return redirect(url_for('invoices_list'))
     return render_view('billing/invoices_new.html', owners=owners, types=types)
 
+@app.route('/billing/invoices/generate', methods=['POST'])
+def invoices_generate():
+    try:
+        stats = generate_invoices(request.form.get('period', ''))
+    except ValueError:
+        flash('账期格式应为 YYYY-MM', 'danger')
+        return redirect(url_for('invoices_list'))
+    flash(f"账期 {stats['period']} 已生成 {stats['created']} 张账单（{stats['rows_per_sec']:.0f} 行/秒）", 'success')
+    return redirect(url_for('invoices_list'))
+
 @app.route('/billing/payments')
+@read_only
 def payments_list():
-    owners = Owner.query.all()
-    invoices = Invoice.query.filter(Invoice.status!="已支付").all()
-    payments = Payment.query.order_by(Payment.paid_at.desc()).all()
+    query = Payment.query.options(joinedload(Payment.owner), joinedload(Payment.invoice))
+    page = keyset_paginate(query, [Payment.paid_at, Payment.id], desc=True)
+    payments = page.items
     
-    # 为每个账单计算已缴费金额
-    invoice_paid = {}
-    for inv in Invoice.query.all():
-        paid = sum([p.amount for p in Payment.query.filter_by(invoice_id=inv.id).all()])
-        invoice_paid[inv.id] = paid
+    # 只汇总当前页缴费记录关联的账单
+    invoice_paid = paid_totals(p.invoice_id for p in payments)
     
-    return render_view('billing/payments.html', payments=payments, owners=owners, invoices=invoices, invoice_paid=invoice_paid)
+    return render_view('billing/payments.html', payments=payments, page=page, invoice_paid=invoice_paid)
+
+@app.route('/billing/payments/export')
+@read_only
+def payments_export():
+    return csv_export('payments', payment_export, 'payments_list')
 
 @app.route('/billing/payments/new', methods=['GET','POST'])
 def payments_new():
     if request.method == 'POST':
-        p = Payment(
-            owner_id=int(request.form['owner_id']), 
-            invoice_id=int(request.form['invoice_id']) if request.form.get('invoice_id') else None, 
-            amount=float(request.form['amount']), 
-            method=request.form.get('method'), 
-            note=request.form.get('note')
-        )
-        inv_id = request.form.get('invoice_id')
-        if inv_id:
-            inv = Invoice.query.get(int(inv_id))
-            if inv:
-                # 计算该账单的总已缴费金额
-                total_paid = sum([pay.amount for pay in Payment.query.filter_by(invoice_id=int(inv_id)).all()])
-                total_paid += p.amount  # 加上本次缴费
-                
-                # 更新未付金额
-                inv.unpaid_amount = max(0, inv.amount - total_paid)
-                
-                # 如果已缴费金额大于等于账单金额，标记为已支付
-                if total_paid >= inv.amount:
-                    inv.status = "已支付"
-                    inv.unpaid_amount = 0
-        db.session.add(p); db.session.commit()
-        flash('已记录缴费', 'success')
+        try:
+            _, created = post_payment(
+                owner_id=int(request.form['owner_id']),
+                invoice_id=int(request.form['invoice_id']) if request.form.get('invoice_id') else None,
+                amount=request.form['amount'],
+                method=request.form.get('method'),
+                note=request.form.get('note'),
+                idempotency_key=request.form.get('idempotency_key')
+            )
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('payments_new'))
+        flash('已记录缴费' if created else '该缴费已记录，未重复入账', 'success' if created else 'warning')
         return redirect(url_for('payments_list'))
     
     owners = Owner.query.all()
-    invoices = Invoice.query.filter(Invoice.status!="已支付").all()
+    invoices = Invoice.query.options(joinedload(Invoice.owner)).filter(Invoice.status.in_(UNPAID_STATUSES)).all()
     
-    # 为每个账单计算已缴费金额
-    invoice_paid = {}
-    for inv in Invoice.query.all():
-        paid = sum([p.amount for p in Payment.query.filter_by(invoice_id=inv.id).all()])
-        invoice_paid[inv.id] = paid
+    # 只汇总下拉框中的未结清账单
+    invoice_paid = paid_totals(inv.id for inv in invoices)
     
-    return render_view('billing/payments_new.html', owners=owners, invoices=invoices, invoice_paid=invoice_paid)
+    # 表单带上幂等键，重复提交只入账一次
+    return render_view('billing/payments_new.html', owners=owners, invoices=invoices, invoice_paid=invoice_paid, idempotency_key=uuid.uuid4().hex)
+
+@app.route('/api/payments/batch', methods=['POST'])
+def payments_batch():
+    data = request.get_json(silent=True)
+    items = data.get('payments') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return jsonify(error='请求体应为 {"payments": [...]}'), 400
+    results = post_payments(items)
+    return jsonify(
+        created=sum(r['status'] == 'created' for r in results),
+        duplicates=sum(r['status'] == 'duplicate' for r in results),
+        errors=sum(r['status'] == 'error' for r in results),
+        results=results
+    )
+
+# 只读 JSON API，筛选条件与列表页一致，支持 ETag / Last-Modified 条件请求和 ?since= 增量
+@app.route('/api/announcements')
+@read_only
+def api_announcements():
+    return api.conditional_list(Announcement.query, Announcement.created_at,
+                                [Announcement.created_at, Announcement.id], api.announcement_json)
+
+@app.route('/api/workorders')
+@read_only
+def api_workorders():
+    query = WorkOrder.query
+    if request.args.get('status'):
+        query = query.filter_by(status=request.args['status'])
+    if request.args.get('owner_id', type=int):
+        query = query.filter_by(owner_id=request.args.get('owner_id', type=int))
+    return api.conditional_list(query, WorkOrder.updated_at, [WorkOrder.created_at, WorkOrder.id], api.workorder_json)
+
+@app.route('/api/invoices')
+@read_only
+def api_invoices():
+    query = Invoice.query
+    if request.args.get('status'):
+        query = query.filter_by(status=request.args['status'])
+    if request.args.get('owner_id', type=int):
+        query = query.filter_by(owner_id=request.args.get('owner_id', type=int))
+    return api.conditional_list(query, Invoice.updated_at, [Invoice.due_date, Invoice.id], api.invoice_json,
+                                desc=False, options=[joinedload(Invoice.charge_type)])
 
 @app.route('/equipment')
+@read_only
 def equipment_list():
     q = request.args.get('q','').strip()
     query = Equipment.query
     if q:
-        like = f"%{q}%"
-        query = query.filter((Equipment.name.like(like)) | (Equipment.location.like(like)) | (Equipment.serial.like(like)))
-    items = query.order_by(Equipment.id.desc()).all()
-    return render_view('equipment/list.html', items=items, q=q)
+        query = query.filter(search_filter(Equipment, q))
+    page = keyset_paginate(query, [Equipment.id], desc=True)
+    return render_view('equipment/list.html', items=page.items, page=page, q=q)
+
+@app.route('/equipment/maintenance-forecast')
+@read_only
+def maintenance_forecast():
+    months = min(max(request.args.get('months', 12, type=int), 1), 36)
+    return render_view('equipment/forecast.html', rows=forecast(months), months=months)
+
+@app.route('/equipment/analytics')
+@read_only
+def equipment_analytics():
+    by = request.args.get('by', 'equipment_type')
+    if by not in GROUP_COLUMNS:
+        by = 'equipment_type'
+    use_rollup = app.config['EQUIPMENT_ROLLUP']
+    years, groups, cells = yearly_costs(by, use_rollup)
+    return render_view('equipment/analytics.html', by=by, rows=equipment_costs(by, use_rollup),
+                       years=years, groups=groups, cells=cells)
 
 @app.route('/equipment/new', methods=['GET','POST'])
 def equipment_new():
     if request.method == 'POST':
         install_date = datetime.strptime(request.form['install_date'], '%Y-%m-%d').date() if request.form.get('install_date') else None
-        usage_years = None
-        if install_date:
-            from dateutil.relativedelta import relativedelta
-            usage_years = (date.today() - install_date).days / 365.25
         
         item = Equipment(
             name=request.form['name'],
@@ -310,8 +672,7 @@ def equipment_new():
             location=request.form.get('location'),
             serial=request.form.get('serial'),
             status=request.form.get('status'),
-            install_date=install_date,
-            usage_years=usage_years
+            install_date=install_date
         )
         db.session.add(item); db.session.commit()
         return redirect(url_for('equipment_list'))
@@ -328,10 +689,7 @@ def equipment_detail(eid):
         eq.serial = request.form.get('serial')
         eq.status = request.form.get('status')
         if request.form.get('install_date'):
-            install_date = datetime.strptime(request.form['install_date'], '%Y-%m-%d').date()
-            eq.install_date = install_date
-            from dateutil.relativedelta import relativedelta
-            eq.usage_years = (date.today() - install_date).days / 365.25
+            eq.install_date = datetime.strptime(request.form['install_date'], '%Y-%m-%d').date()
         db.session.commit()
         return redirect(url_for('equipment_detail', eid=eid))
     plans = MaintenancePlan.query.filter_by(equipment_id=eid).all()
@@ -341,7 +699,8 @@ def equipment_detail(eid):
 
 @app.route('/equipment/<int:eid>/plan/new', methods=['POST'])
 def plan_new(eid):
-    plan = MaintenancePlan(equipment_id=eid, frequency=request.form.get('frequency'), next_date=datetime.strptime(request.form['next_date'], '%Y-%m-%d').date() if request.form.get('next_date') else None, notes=request.form.get('notes'))
+    next_date = datetime.strptime(request.form['next_date'], '%Y-%m-%d').date() if request.form.get('next_date') else None
+    plan = MaintenancePlan(equipment_id=eid, frequency=request.form.get('frequency'), next_date=next_date, anchor_date=next_date, notes=request.form.get('notes'))
     db.session.add(plan); db.session.commit()
     return redirect(url_for('equipment_detail', eid=eid))
 
@@ -360,13 +719,29 @@ def maintenance_record_new(eid):
     return redirect(url_for('equipment_detail', eid=eid))
 
 @app.route('/workorders')
+@read_only
 def workorders_list():
     status = request.args.get('status','')
-    query = WorkOrder.query
+    # 列表不展示业主/设备，禁止逐行懒加载
+    query = WorkOrder.query.options(raiseload(WorkOrder.requester), raiseload(WorkOrder.equipment))
     if status:
         query = query.filter_by(status=status)
-    wos = query.order_by(WorkOrder.created_at.desc()).all()
-    return render_view('workorders/list.html', wos=wos, status=status)
+    page = keyset_paginate(query, [WorkOrder.created_at, WorkOrder.id], desc=True)
+    return render_view('workorders/list.html', wos=page.items, page=page, status=status)
+
+@app.route('/workorders/export')
+@read_only
+def workorders_export():
+    return csv_export('workorders', workorder_export, 'workorders_list')
+
+@app.route('/workorders/sla')
+@read_only
+def workorders_sla():
+    by = request.args.get('by', 'repairer')
+    if by not in SLA_DIMENSIONS:
+        by = 'repairer'
+    months = min(max(request.args.get('months', 6, type=int), 1), 24)
+    return render_view('workorders/sla.html', rows=sla_report(by, months), by=by, months=months)
 
 @app.route('/workorders/new', methods=['GET','POST'])
 def workorders_new():
@@ -431,10 +806,47 @@ def workorders_detail(wid):
 def announcements():
     if request.method == 'POST':
         ann = Announcement(title=request.form['title'], content=request.form['content'], send_email=bool(request.form.get('send_email')))
-        db.session.add(ann); db.session.commit()
+        db.session.add(ann)
+        queued = None
+        if ann.send_email:
+            # 公告与发件箱在同一事务提交，由后台 worker 发送
+            db.session.flush()
+            queued = enqueue_announcement(ann)
+        db.session.commit()
+        if queued is not None:
+            flash(f'已加入邮件队列：{queued} 位业主', 'success')
         return redirect(url_for('announcements'))
-    anns = Announcement.query.order_by(Announcement.created_at.desc()).all()
-    return render_view('announcements/list.html', anns=anns)
+    page = keyset_paginate(Announcement.query, [Announcement.created_at, Announcement.id], desc=True)
+    deliveries = delivery_counts([a.id for a in page.items if a.send_email])
+    return render_view('announcements/list.html', anns=page.items, page=page, deliveries=deliveries)
+
+def metrics_authorized():
+    # 慢查询样本含 SQL 原文：未设置 METRICS_TOKEN 时只在调试、测试模式下开放
+    token = app.config['METRICS_TOKEN']
+    if not token:
+        return app.debug or app.testing
+    return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+@app.route('/metrics')
+def metrics_endpoint():
+    if not metrics_authorized():
+        return Response('unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/slow-queries')
+def metrics_slow_queries():
+    if not metrics_authorized():
+        return jsonify(error='unauthorized'), 401
+    return jsonify(slow_query_ms=app.config['SLOW_QUERY_MS'], samples=list(reversed(metrics.registry.slow_samples)))
+
+@app.route('/metrics/profiles/<profile_id>')
+def metrics_profile(profile_id):
+    if not metrics_authorized():
+        return Response('unauthorized\n', status=401, mimetype='text/plain')
+    item = metrics.registry.profile(profile_id)
+    if item is None:
+        return Response('not found\n', status=404, mimetype='text/plain')
+    return Response(f"{item['at']} {item['path']}\n\n{item['stats']}", mimetype='text/plain')
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,370 @@
+import json
+import os
+import random
+import re
+import subprocess
+import time
+import tracemalloc
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, date, timedelta
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import insert, update
+from models import db, Owner, ChargeType, Invoice, Payment, Equipment, MaintenancePlan, WorkOrder, MaintenanceRecord, Announcement
+from billing import generate_invoices
+from analytics import rebuild_rollup, rebuild_sla_rollup
+from ledger import reconcile_accounts
+from reports import rebuild_reports
+from parking import sync_owners
+from querybudget import record_statements
+
+SURNAMES = "王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗"
+GIVEN = "伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚桂英华玉兰"
+UNIT_TYPES = ["一室一厅", "两室一厅", "两室两厅", "三室一厅", "三室两厅", "四室及以上"]
+CAR_MODELS = ["Tesla 3", "BMW X5", "Toyota Camry", "Audi A6", "Volkswagen Passat", "BYD Han", "Honda Accord"]
+EQUIPMENT_TYPES = [("电梯", "EL"), ("空调", "AC"), ("水管", "WP"), ("燃气", "GAS"), ("其他", "OT")]
+WORKORDER_TYPES = ["维修", "投诉", "保洁", "其他"]
+REPAIRERS = ["老刘", "小王", "张师傅", "李师傅", "陈工"]
+BATCH = 2000
+
+def _insert_batches(model, rows):
+    for start in range(0, len(rows), BATCH):
+        db.session.execute(insert(model), rows[start:start + BATCH])
+    db.session.commit()
+
+def _owners(rng, count):
+    rows, spot = [], 0
+    buildings = "ABCDEFGH"
+    for i in range(count):
+        b, rest = buildings[i % len(buildings)], i // len(buildings)
+        unit = f"{b}-{rest % 6 + 1}-{rest // 6 // 4 % 30 + 1}{rest // 6 % 4 + 1:02d}"
+        if rest >= 6 * 4 * 30:
+            unit += f"-{rest // (6 * 4 * 30)}"
+        n_cars = rng.choices([0, 1, 2, 3], weights=[30, 50, 15, 5])[0]
+        cars = [{"plate": f"沪{rng.choice('ABCDEFGHJK')}{rng.randint(10000, 99999)}", "model": rng.choice(CAR_MODELS)} for _ in range(n_cars)]
+        spots = []
+        for _ in range(n_cars):
+            spot += 1
+            spots.append(f"P-{spot:04d}")
+        rows.append(dict(
+            name=rng.choice(SURNAMES) + "".join(rng.choice(GIVEN) for _ in range(rng.randint(1, 2))),
+            phone=f"1{rng.choice('3589')}{rng.randint(0, 999999999):09d}",
+            email=f"owner{i}@example.com",
+            unit=unit,
+            area=round(rng.uniform(45, 180), 1),
+            unit_type=rng.choice(UNIT_TYPES),
+            vehicles=json.dumps(cars, ensure_ascii=False),
+            parking_spots=",".join(spots),
+            created_at=datetime.utcnow() - timedelta(days=rng.randint(0, 1000)),
+        ))
+    return rows
+
+def _payments(rng, today):
+    """已到期账单约 85% 结清，其余保持未支付"""
+    rows, paid_ids = [], []
+    due = db.session.query(Invoice.id, Invoice.owner_id, Invoice.amount, Invoice.due_date).filter(
+        Invoice.status == "未支付", Invoice.due_date < today)
+    for inv_id, owner_id, amount, due_date in due.yield_per(BATCH):
+        if rng.random() < 0.85:
+            paid_ids.append(inv_id)
+            rows.append(dict(
+                owner_id=owner_id, invoice_id=inv_id, amount=amount,
+                method=rng.choice(["线上", "线下", "现金", "银行转账"]),
+                paid_at=datetime.combine(due_date, datetime.min.time()) - timedelta(days=rng.randint(0, 20), minutes=rng.randint(0, 1440)),
+            ))
+    _insert_batches(Payment, rows)
+    for start in range(0, len(paid_ids), BATCH):
+        db.session.execute(update(Invoice).where(Invoice.id.in_(paid_ids[start:start + BATCH])).values(status="已支付", unpaid_amount=0))
+    db.session.commit()
+    return len(rows)
+
+def _equipment(rng, count, months, today):
+    eq_rows = []
+    for i in range(count):
+        etype, prefix = EQUIPMENT_TYPES[i % len(EQUIPMENT_TYPES)]
+        install = today - timedelta(days=rng.randint(200, 5000))
+        eq_rows.append(dict(
+            name=f"{i + 1}号{etype}", equipment_type=etype, model=f"M-{rng.randint(100, 999)}",
+            location=f"{'ABCDEFGH'[i % 8]}座", serial=f"{prefix}-{i + 1:04d}",
+            status=rng.choices(["正常", "维护", "停用"], weights=[85, 10, 5])[0],
+            install_date=install,
+        ))
+    _insert_batches(Equipment, eq_rows)
+    ids = [i for (i,) in db.session.query(Equipment.id).order_by(Equipment.id.desc()).limit(count)]
+    plans, records = [], []
+    for eid in ids:
+        plans.append(dict(equipment_id=eid, frequency=rng.choice(["每月", "每季度", "每半年", "每年"]),
+                          next_date=today + timedelta(days=rng.randint(-30, 180))))
+        for _ in range(rng.randint(0, max(1, months // 3))):
+            records.append(dict(
+                equipment_id=eid, repair_date=today - timedelta(days=rng.randint(0, months * 30)),
+                main_issue="例行检修", repair_cost=round(rng.uniform(50, 5000), 2),
+                is_fixed=rng.random() < 0.9, is_replaced=rng.random() < 0.1,
+            ))
+    _insert_batches(MaintenancePlan, plans)
+    _insert_batches(MaintenanceRecord, records)
+    rebuild_rollup()   # 批量插入不触发增量维护
+    return ids, len(records)
+
+def _workorders(rng, count, months, owner_ids, equipment_ids):
+    rows = []
+    now = datetime.utcnow()
+    for _ in range(count):
+        created = now - timedelta(days=rng.uniform(0, months * 30))
+        status = rng.choices(["新建", "处理中", "已完成", "已关闭"], weights=[5, 10, 60, 25])[0]
+        row = dict(
+            type=rng.choice(WORKORDER_TYPES), description="业主报修：" + rng.choice(["漏水", "电梯异响", "门禁故障", "噪音投诉", "楼道保洁"]),
+            status=status, priority=rng.choice(["低", "中", "高"]), created_at=created,
+            owner_id=rng.choice(owner_ids), equipment_id=rng.choice(equipment_ids) if rng.random() < 0.4 else None,
+            assignee="物业前台", repairer=rng.choice(REPAIRERS),
+        )
+        if status != "新建":
+            row["assigned_at"] = created + timedelta(hours=rng.uniform(0.2, 24))
+        if status in ("已完成", "已关闭"):
+            row["completed_at"] = row["assigned_at"] + timedelta(hours=rng.uniform(1, 72))
+            row["closed_at"] = row["completed_at"]
+            row["satisfaction"] = rng.choices(["满意", "不满意", "未评价"], weights=[75, 10, 15])[0]
+        rows.append(row)
+    _insert_batches(WorkOrder, rows)
+    rebuild_sla_rollup()
+
+def seed(owners, months, random_seed=0):
+    """生成压测数据：业主、收费项目、近 months 个月的账单/缴费、设备、工单与维修记录"""
+    rng = random.Random(random_seed)
+    today = date.today()
+    stats = {}
+    began = time.perf_counter()
+
+    _insert_batches(Owner, _owners(rng, owners))
+    owner_ids = [i for (i,) in db.session.query(Owner.id)]
+    sync_owners(owner_ids)
+    db.session.commit()
+    stats["owners"] = owners
+
+    if not ChargeType.query.count():
+        db.session.add_all([
+            ChargeType(name="物业费", billing_cycle="月", unit="月", price=2.5, link_to="area", description="2.5元/㎡·月"),
+            ChargeType(name="停车费", billing_cycle="月", unit="月", price=300, link_to="vehicles", description="300元/月·辆"),
+            ChargeType(name="垃圾清运费", billing_cycle="季", unit="季", price=60, link_to="none"),
+        ])
+        db.session.commit()
+
+    first = today.replace(day=1) - relativedelta(months=months - 1)
+    stats["invoices"] = sum(
+        generate_invoices((first + relativedelta(months=m)).strftime("%Y-%m"))["created"] for m in range(months)
+    )
+    stats["payments"] = _payments(rng, today)
+    reconcile_accounts()   # 批量插入的缴费不经过增量维护
+    rebuild_reports()
+
+    equipment_ids, stats["maintenance_records"] = _equipment(rng, max(5, owners // 100), months, today)
+    stats["equipment"] = len(equipment_ids)
+    stats["workorders"] = max(10, owners * months // 20)
+    _workorders(rng, stats["workorders"], months, owner_ids, equipment_ids)
+
+    db.session.add_all([
+        Announcement(title=f"社区通知 {i + 1}", content="请各位业主留意近期安排。", created_at=datetime.utcnow() - timedelta(days=i * 7))
+        for i in range(min(200, months * 4))
+    ])
+    db.session.commit()
+    stats["seconds"] = round(time.perf_counter() - began, 2)
+    return stats
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[k]
+
+def _route_paths(app):
+    """所有可 GET 的路由，带参数的路由取对应表的第一条记录"""
+    with app.app_context():
+        sample = {
+            "oid": db.session.query(Owner.id).order_by(Owner.id).limit(1).scalar(),
+            "eid": db.session.query(Equipment.id).order_by(Equipment.id).limit(1).scalar(),
+            "wid": db.session.query(WorkOrder.id).order_by(WorkOrder.id).limit(1).scalar(),
+        }
+    paths = []
+    for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
+        if "GET" not in rule.methods or rule.endpoint == "static":
+            continue
+        if any(sample.get(arg) is None for arg in rule.arguments):
+            continue
+        paths.append(rule.build({arg: sample[arg] for arg in rule.arguments})[1])
+    return paths
+
+def run_benchmark(app, iterations=20, paths=None):
+    """用测试客户端逐个请求路由，统计延迟分位数、SQL 条数与内存峰值"""
+    client = app.test_client()
+    results = {}
+    for path in paths or _route_paths(app):
+        timings = []
+        status = client.get(path).status_code   # 预热
+        for _ in range(iterations):
+            started = time.perf_counter()
+            client.get(path)
+            timings.append((time.perf_counter() - started) * 1000)
+        # 单独一次请求统计 SQL 条数和内存峰值，避免 tracemalloc 影响计时
+        with record_statements() as statements:
+            tracemalloc.start()
+            client.get(path)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        results[path] = {
+            "status": status,
+            "p50_ms": round(_percentile(timings, 50), 2),
+            "p95_ms": round(_percentile(timings, 95), 2),
+            "p99_ms": round(_percentile(timings, 99), 2),
+            "sql_statements": len(statements),
+            "peak_memory_kb": round(peak / 1024, 1),
+        }
+    return results
+
+# 带筛选条件的页面，补充 _route_paths 覆盖不到的查询
+EXPLAIN_PATHS = [
+    "/owners?sort=arrears", "/billing/invoices?status=未支付", "/workorders?status=新建",
+    "/api/invoices?status=未支付", "/api/workorders?status=新建",
+    "/billing/invoices/export?start=2026-01-01&end=2026-03-31", "/billing/payments/export?start=2026-01-01&end=2026-03-31",
+    "/workorders/export?start=2026-01-01&end=2026-03-31",
+]
+# 允许整表扫描的表：行数固定的小表
+FULL_SCAN_OK = {"charge_type"}
+# 逐条查询的例外：(请求路径, 表, 扫描所用索引) -> 原因；索引为 None 表示按表顺序扫描（SQLite 按 rowid）；
+# 带游标的翻页请求记为 路径?after=*
+FULL_SCAN_EXEMPT = {
+    ("/", "owner", "ix_owner_created_at"): "首页业主总数；最近业主按索引顺序读 LIMIT 行",
+    ("/", "work_order", "ix_work_order_status_created_at"): "首页未完成工单数",
+    ("/", "equipment", None): "首页设备总数",
+    ("/", "announcement", "ix_announcement_created_at"): "首页最新公告，按索引顺序读一条",
+    ("/", "work_order", "ix_work_order_created_at"): "首页最近工单，按索引顺序读 LIMIT 行",
+    ("/owners", "owner", None): "列表第一页，按主键倒序读 LIMIT 行",
+    ("/equipment", "equipment", None): "列表第一页，按主键倒序读 LIMIT 行",
+    ("/announcements", "announcement", "ix_announcement_created_at"): "列表第一页，按索引顺序读 LIMIT 行",
+    ("/billing/invoices", "invoice", "ix_invoice_due_date"): "列表第一页，按索引顺序读 LIMIT 行",
+    ("/billing/payments", "payment", "ix_payment_paid_at"): "列表第一页，按索引顺序读 LIMIT 行",
+    ("/workorders", "work_order", "ix_work_order_created_at"): "列表第一页，按索引顺序读 LIMIT 行",
+    ("/api/invoices", "invoice", "ix_invoice_due_date"): "列表第一页，按索引顺序读 LIMIT 行",
+    ("/api/invoices", "invoice", "ix_invoice_updated_at"): "ETag：全表行数与最大 updated_at，只读覆盖索引",
+    ("/api/workorders", "work_order", "ix_work_order_created_at"): "列表第一页，按索引顺序读 LIMIT 行",
+    ("/api/workorders", "work_order", "ix_work_order_updated_at"): "ETag：全表行数与最大 updated_at，只读覆盖索引",
+    ("/api/invoices?after=*", "invoice", "ix_invoice_updated_at"): "ETag：全表行数与最大 updated_at，只读覆盖索引",
+    ("/api/workorders?after=*", "work_order", "ix_work_order_updated_at"): "ETag：全表行数与最大 updated_at，只读覆盖索引",
+    ("/api/announcements", "announcement", "ix_announcement_created_at"): "列表第一页与 ETag",
+    ("/billing/invoices/export", "invoice", "ix_invoice_due_date"): "不带日期范围时导出全部账单",
+    ("/billing/payments/export", "payment", "ix_payment_paid_at"): "不带日期范围时导出全部缴费",
+    ("/workorders/export", "work_order", "ix_work_order_created_at"): "不带日期范围时导出全部工单",
+    ("/billing/invoices/new", "owner", None): "下拉框列出全部业主",
+    ("/billing/payments/new", "owner", None): "下拉框列出全部业主",
+    ("/workorders/new", "owner", None): "下拉框列出全部业主",
+    ("/workorders/new", "equipment", None): "下拉框列出全部设备",
+    ("/equipment/analytics", "equipment", None): "按类型统计全部设备",
+    ("/equipment/analytics", "maintenance_record", None): "未启用 EQUIPMENT_ROLLUP 时按年汇总全部维修记录",
+    ("/equipment/analytics", "maintenance_record", "ix_maintenance_record_equipment_date"): "未启用 EQUIPMENT_ROLLUP 时按设备汇总全部维修记录",
+}
+# SQLite：SCAN t、SCAN t USING [COVERING] INDEX ix 都是读整张表或整个索引；SEARCH 才是按条件定位
+_SQLITE_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?(?: USING (?:COVERING )?INDEX (\w+))?")
+_PG_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+def _query_plan(connection, statement, parameters):
+    """EXPLAIN 一条语句，返回执行计划里整表扫描的 [(表名, 索引名或 None)]"""
+    if connection.dialect.name == "sqlite":
+        plan = [row[-1] for row in connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+        matches = [_SQLITE_SCAN.match(line) for line in plan]
+        scans = [(m.group(1), m.group(2)) for m in matches if m]
+    elif connection.dialect.name == "postgresql":
+        plan = [row[0] for row in connection.exec_driver_sql("EXPLAIN " + statement, parameters)]
+        scans = [(m.group(1), None) for m in map(_PG_SCAN.search, plan) if m]
+    else:
+        return []
+    # 子查询、CTE 的别名不是表
+    return [(table, index) for table, index in scans if table in db.metadata.tables]
+
+def _exempt_path(path):
+    """例外按请求路径登记：忽略 per_page，游标值记为 *（翻页后的 seek 查询与第一页分开登记）"""
+    parts = urllib.parse.urlsplit(path)
+    query = [(k, "*" if k in ("after", "before") else v)
+             for k, v in urllib.parse.parse_qsl(parts.query) if k != "per_page"]
+    return parts.path + ("?" + urllib.parse.urlencode(query, safe="*") if query else "")
+
+def explain_routes(app, paths=None):
+    """请求各路由，对其中每条 SELECT 做 EXPLAIN，返回 [(路由, 表, 语句)] 形式的整表扫描列表"""
+    client = app.test_client()
+    scans = []
+    for path in paths or _route_paths(app) + EXPLAIN_PATHS:
+        with record_statements() as statements:
+            client.get(path).get_data()   # 导出是流式响应，读完才会执行全部查询
+        selects = [(s, p) for s, p, many in statements if not many and s.lstrip().upper().startswith(("SELECT", "WITH"))]
+        with app.app_context(), db.engine.connect() as connection:
+            for statement, parameters in selects:
+                for table, index in _query_plan(connection, statement, parameters):
+                    if table in FULL_SCAN_OK or (_exempt_path(path), table, index) in FULL_SCAN_EXEMPT:
+                        continue
+                    scans.append((path, table, " ".join(statement.split())))
+    return scans
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def benchmark_report(app, iterations=20):
+    with app.app_context():
+        counts = {m.__tablename__: db.session.query(m).count() for m in (Owner, Invoice, Payment, WorkOrder, Equipment)}
+        dialect = db.engine.dialect.name
+    return {
+        "commit": _git_commit(),
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "database": dialect,
+        "iterations": iterations,
+        "rows": counts,
+        "routes": run_benchmark(app, iterations),
+    }
+
+THROUGHPUT_PATHS = ["/owners", "/billing/invoices", "/workorders", "/api/invoices", "/equipment/analytics"]
+
+def run_throughput(base_url, concurrency=16, duration=10, write_ratio=0.2, paths=None):
+    """对运行中的服务（如 gunicorn 多 worker）并发压测：读列表页，按比例穿插新建工单的写请求"""
+    paths = paths or THROUGHPUT_PATHS
+    deadline = time.monotonic() + duration
+    lock = threading.Lock()
+    totals = {"reads": 0, "writes": 0, "errors": 0}
+    timings = []
+
+    def worker(n):
+        rng = random.Random(n)
+        opener = urllib.request.build_opener()   # 不跟随会话 cookie，每个请求独立
+        local, done = [], {"reads": 0, "writes": 0, "errors": 0}
+        while time.monotonic() < deadline:
+            write = rng.random() < write_ratio
+            if write:
+                data = urllib.parse.urlencode({"type": "维修", "description": f"压测工单 {n}", "priority": "中"}).encode()
+                req = urllib.request.Request(base_url + "/workorders/new", data=data)
+            else:
+                req = urllib.request.Request(base_url + rng.choice(paths))
+            started = time.perf_counter()
+            try:
+                with opener.open(req, timeout=30) as resp:
+                    resp.read()
+                done["writes" if write else "reads"] += 1
+            except (urllib.error.URLError, OSError):
+                done["errors"] += 1
+            local.append((time.perf_counter() - started) * 1000)
+        with lock:
+            timings.extend(local)
+            for k, v in done.items():
+                totals[k] += v
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    began = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - began
+    ok = totals["reads"] + totals["writes"]
+    return dict(totals, concurrency=concurrency, seconds=round(elapsed, 2), requests_per_sec=round(ok / elapsed, 1),
+                p50_ms=round(_percentile(timings, 50), 2) if timings else None,
+                p95_ms=round(_percentile(timings, 95), 2) if timings else None)
@@ -0,0 +1,193 @@
+import math
+import time
+from datetime import datetime, date
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import func, literal, exists, insert, select, update, case
+from sqlalchemy.exc import IntegrityError
+from models import db, Owner, ChargeType, Invoice, Payment
+from ledger import post_billed
+from reports import post_period_billed
+
+# IN 列表分批大小，避免超长 SQL
+CHUNK_SIZE = 500
+
+def paid_totals(invoice_ids):
+    """按账单汇总已缴费金额：{invoice_id: 已缴费}，每批一次 GROUP BY 查询"""
+    ids = sorted({i for i in invoice_ids if i is not None})
+    totals = {}
+    for start in range(0, len(ids), CHUNK_SIZE):
+        chunk = ids[start:start + CHUNK_SIZE]
+        rows = (db.session.query(Payment.invoice_id, func.sum(Payment.amount))
+                .filter(Payment.invoice_id.in_(chunk))
+                .group_by(Payment.invoice_id)
+                .all())
+        for invoice_id, total in rows:
+            totals[invoice_id] = total or 0
+    return totals
+
+# 剩余金额小于半分即视为结清，避免浮点误差
+PAID_EPSILON = 0.005
+
+# 未结清的账单状态；用 IN 而不是 != '已支付'，可以走 status 索引
+UNPAID_STATUSES = ("未支付", "逾期")
+
+def _existing_payment(idempotency_key):
+    return Payment.query.filter_by(idempotency_key=idempotency_key).first() if idempotency_key else None
+
+def parse_amount(value):
+    """金额按分四舍五入；非数字、无穷大、NaN 抛 ValueError"""
+    try:
+        amount = Decimal(str(value).strip()).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    except (InvalidOperation, ValueError):
+        raise ValueError("缴费金额应为有效数字") from None
+    if not amount.is_finite() or not math.isfinite(float(amount)):
+        raise ValueError("缴费金额应为有效数字")
+    if amount <= 0:
+        raise ValueError("缴费金额必须大于 0")
+    return float(amount)
+
+def post_payment(owner_id, invoice_id, amount, method=None, note=None, idempotency_key=None):
+    """记一笔缴费并在同一事务内原子扣减账单未付金额，返回 (payment, 是否新建)"""
+    amount = parse_amount(amount)   # 写库前校验，避免 inf/NaN 进入账单和汇总
+    existing = _existing_payment(idempotency_key)
+    if existing:
+        return existing, False
+    if owner_id is None:
+        if not invoice_id:
+            raise ValueError("缺少业主")
+        owner_id = db.session.query(Invoice.owner_id).filter_by(id=invoice_id).scalar()
+        if owner_id is None:
+            raise ValueError(f"账单 #{invoice_id} 不存在")
+
+    p = Payment(owner_id=owner_id, invoice_id=invoice_id, amount=amount, method=method, note=note,
+                idempotency_key=idempotency_key or None)
+    db.session.add(p)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # 并发重复提交：另一个请求已用同一幂等键写入
+        db.session.rollback()
+        existing = _existing_payment(idempotency_key)
+        if existing:
+            return existing, False
+        raise
+
+    if invoice_id:
+        # 在数据库内做减法，不依赖读到的旧余额；并发记账由行锁串行化
+        remaining = func.coalesce(Invoice.unpaid_amount, Invoice.amount) - amount
+        settled = remaining <= PAID_EPSILON
+        stmt = (update(Invoice)
+                .where(Invoice.id == invoice_id)
+                .values(unpaid_amount=case((settled, 0), else_=remaining),
+                        status=case((settled, "已支付"), else_=Invoice.status))
+                .execution_options(synchronize_session=False))
+        if db.engine.dialect.update_returning:
+            updated = db.session.execute(stmt.returning(Invoice.id)).first() is not None
+        else:
+            updated = db.session.execute(stmt).rowcount > 0
+        if not updated:
+            db.session.rollback()
+            raise ValueError(f"账单 #{invoice_id} 不存在")
+    db.session.commit()
+    return p, True
+
+def post_payments(items):
+    """批量记账（银行对账文件），每条独立事务，返回逐条结果"""
+    results = []
+    for index, item in enumerate(items):
+        try:
+            amount = item.get("amount")
+            owner_id = int(item["owner_id"]) if item.get("owner_id") else None
+            invoice_id = int(item["invoice_id"]) if item.get("invoice_id") else None
+            p, created = post_payment(owner_id, invoice_id, amount, item.get("method"), item.get("note"),
+                                      item.get("idempotency_key"))
+        except (TypeError, ValueError, IntegrityError) as e:
+            db.session.rollback()
+            results.append({"index": index, "status": "error", "error": str(e.orig if isinstance(e, IntegrityError) else e)})
+            continue
+        result = {"index": index, "status": "created" if created else "duplicate", "payment_id": p.id}
+        if p.invoice_id:
+            inv = db.session.get(Invoice, p.invoice_id)
+            result.update(invoice_id=inv.id, unpaid_amount=inv.unpaid_amount, invoice_status=inv.status)
+        results.append(result)
+    return results
+
+# 各计费周期在哪些月份出账
+CYCLE_MONTHS = {
+    "月": set(range(1, 13)),
+    "季": {1, 4, 7, 10},
+    "年": {1},
+}
+
+def parse_period(period):
+    """'2026-11' -> date(2026, 11, 1)，格式错误抛 ValueError"""
+    return datetime.strptime(period, '%Y-%m').date()
+
+def charge_quantity(charge_type):
+    """与 invoices_new 相同的计费数量规则，作为 SQL 表达式"""
+    if charge_type.link_to == 'area':
+        return func.coalesce(Owner.area, 0)
+    if charge_type.link_to == 'vehicles':
+        return func.coalesce(Owner.vehicle_count, 0)
+    return literal(1)
+
+def generate_invoices(period, chunk_size=1000):
+    """为所有业主按收费项目批量生成账期账单，重复执行不会重复出账"""
+    start = parse_period(period)
+    period = start.strftime('%Y-%m')   # 2026-7 与 2026-07 是同一账期，统一后再查重、入库
+    due_date = start + relativedelta(months=1, days=-1)
+    max_id = db.session.query(func.max(Owner.id)).scalar() or 0
+    stats = {'period': period, 'created': 0, 'charge_types': 0, 'skipped_types': [], 'seconds': 0.0}
+    began = time.perf_counter()
+
+    for ct in ChargeType.query.order_by(ChargeType.id).all():
+        cycle = ct.billing_cycle or '月'
+        if start.month not in CYCLE_MONTHS.get(cycle, ()):
+            stats['skipped_types'].append(ct.name)
+            continue
+        stats['charge_types'] += 1
+        quantity = charge_quantity(ct)
+        price = ct.price or 0
+        already = exists().where(
+            (Invoice.owner_id == Owner.id) & (Invoice.charge_type_id == ct.id) & (Invoice.period == period)
+        )
+        # 按业主 ID 区间分批 INSERT ... SELECT，每批一个事务（含业主账户累加）
+        for low in range(0, max_id, chunk_size):
+            last_id = db.session.query(func.max(Invoice.id)).scalar() or 0
+            rows = (select(Owner.id, literal(ct.id), literal(cycle), quantity, literal(price),
+                           quantity * price, quantity * price, literal(due_date), literal('未支付'),
+                           literal(f"{period} {ct.name}"), literal(period))
+                    .where(Owner.id > low, Owner.id <= low + chunk_size)
+                    .where(quantity > 0)
+                    .where(~already))
+            result = db.session.execute(
+                insert(Invoice).from_select(
+                    ['owner_id', 'charge_type_id', 'billing_cycle', 'quantity', 'price', 'amount',
+                     'unpaid_amount', 'due_date', 'status', 'description', 'period'],
+                    rows,
+                )
+            )
+            if result.rowcount != 0:
+                criteria = (Invoice.id > last_id, Invoice.charge_type_id == ct.id, Invoice.period == period,
+                            Invoice.owner_id > low, Invoice.owner_id <= low + chunk_size)
+                post_billed(*criteria)
+                post_period_billed(*criteria)
+            db.session.commit()
+            stats['created'] += max(result.rowcount or 0, 0)
+
+    stats['seconds'] = time.perf_counter() - began
+    stats['rows_per_sec'] = stats['created'] / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
+
+def mark_overdue(today=None):
+    """到期未支付的账单批量标记为逾期，返回更新行数"""
+    today = today or date.today()
+    result = db.session.execute(
+        update(Invoice)
+        .where(Invoice.status == "未支付", Invoice.due_date < today)
+        .values(status="逾期")
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
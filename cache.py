@@ -0,0 +1,132 @@
+import pickle
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+_MISSING = object()
+
+class TTLCache:
+    """进程内缓存；多个 gunicorn worker 之间不共享，失效只作用于本进程"""
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (ttl or self.ttl))
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+class RedisCache:
+    """共享缓存；client 只需提供 get/set/delete，可用 fakeredis 等本地替身"""
+
+    def __init__(self, client, ttl=60, prefix="pm:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url, ttl=60):
+        import redis   # 可选依赖
+        return cls(redis.Redis.from_url(url), ttl=ttl)
+
+    def get(self, key, default=None):
+        raw = self.client.get(self.prefix + key)
+        return default if raw is None else pickle.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=ttl or self.ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + k for k in keys])
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+
+class Cache:
+    def __init__(self):
+        self.backend = TTLCache()
+        self.dependencies = {}
+
+    def init_app(self, app, backend=None):
+        ttl = app.config.get("CACHE_TTL", 60)
+        url = app.config.get("CACHE_URL")
+        if backend is not None:
+            self.backend = backend
+        elif url:
+            self.backend = RedisCache.from_url(url, ttl=ttl)
+        elif app.config.get("WEB_CONCURRENCY", 1) > 1:
+            # 其他 worker 收不到提交后的失效，会在 TTL 内返回旧的统计数
+            raise RuntimeError("多个 worker 运行时必须设置 CACHE_URL（Redis），进程内缓存无法跨 worker 失效")
+        else:
+            self.backend = TTLCache(ttl=ttl)
+        app.extensions["cache"] = self
+
+    def get_or_set(self, key, compute, ttl=None):
+        value = self.backend.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.backend.set(key, value, ttl)
+        return value
+
+    def invalidate(self, *keys):
+        self.backend.delete(*keys)
+
+    def depends_on(self, key, *models):
+        """声明 key 依赖的模型，这些模型写入并提交后删除 key"""
+        for model in models:
+            if model not in self.dependencies:
+                self.dependencies[model] = set()
+                for name in ("after_insert", "after_update", "after_delete"):
+                    event.listen(model, name, self._on_write)
+            self.dependencies[model].add(key)
+
+    def _mark(self, session, model):
+        keys = self.dependencies.get(model)
+        if session is not None and keys:
+            session.info.setdefault("cache_invalidate", set()).update(keys)
+
+    def _on_write(self, mapper, connection, target):
+        self._mark(object_session(target), mapper.class_)
+
+cache = Cache()
+
+@event.listens_for(Session, "do_orm_execute")
+def _on_bulk_statement(state):
+    # INSERT ... SELECT / 批量 UPDATE 不触发 mapper 事件，在这里补上
+    if (state.is_insert or state.is_update or state.is_delete) and state.bind_mapper is not None:
+        cache._mark(state.session, state.bind_mapper.class_)
+
+# 失效推迟到提交之后，避免其他请求在提交前重新缓存旧值
+@event.listens_for(Session, "after_commit")
+def _on_commit(session):
+    keys = session.info.pop("cache_invalidate", None)
+    if keys:
+        cache.invalidate(*keys)
+
+@event.listens_for(Session, "after_rollback")
+def _on_rollback(session):
+    session.info.pop("cache_invalidate", None)
@@ -10,3 +10,68 @@ class Config:
     
     SQLALCHEMY_DATABASE_URI = db_url
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # 连接池：pre_ping 丢弃已被服务端断开的连接，recycle 早于数据库/代理的空闲超时
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "1") == "1",
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+    }
+    if not db_url.startswith("sqlite"):
+        SQLALCHEMY_ENGINE_OPTIONS.update(
+            pool_size=int(os.environ.get("DB_POOL_SIZE", 5)),
+            max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+            pool_timeout=int(os.environ.get("DB_POOL_TIMEOUT", 30)),
+        )
+
+    # SQLite：默认启用 WAL + synchronous=NORMAL；busy_timeout（毫秒）内等待写锁而不是立即报错
+    SQLITE_WAL = os.environ.get("SQLITE_WAL", "1") == "1"
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get("SQLITE_BUSY_TIMEOUT", 5000))
+
+    # 只读副本：设置后列表、报表等只读 GET 视图的查询走副本；写入后 REPLICA_STICKY_SECONDS 秒内仍读主库
+    SQLALCHEMY_BINDS = {}
+    replica_url = os.environ.get("REPLICA_DATABASE_URL", "")
+    if replica_url:
+        SQLALCHEMY_BINDS["replica"] = replica_url.replace("postgres://", "postgresql://", 1)
+    REPLICA_STICKY_SECONDS = int(os.environ.get("REPLICA_STICKY_SECONDS", 5))
+
+    # 列表分页
+    PAGE_SIZE = int(os.environ.get("PAGE_SIZE", 50))
+    PAGE_SIZES = sorted({20, 50, 100, PAGE_SIZE})
+
+    # 单个请求允许的 SQL 条数，0 表示不检查；TESTING 模式下超出会直接报错
+    SQL_STATEMENT_BUDGET = int(os.environ.get("SQL_STATEMENT_BUDGET", 0))
+
+    # 首页统计缓存：默认进程内 TTL 缓存，设置 CACHE_URL (redis://...) 后多个 worker 共享；
+    # 进程内缓存的失效只作用于写入的那个 worker，多 worker（WEB_CONCURRENCY > 1）时必须设置 CACHE_URL
+    CACHE_URL = os.environ.get("CACHE_URL", "")
+    WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", 1))   # gunicorn 默认按此值启动 worker
+    CACHE_TTL = int(os.environ.get("CACHE_TTL", 60))
+
+    # 进程内逾期扫描间隔（秒），0 表示不启用，改用 flask mark-overdue 定时执行
+    OVERDUE_SWEEP_INTERVAL = int(os.environ.get("OVERDUE_SWEEP_INTERVAL", 0))
+
+    # 公告邮件：未配置 MAIL_SERVER 时只入队不发送
+    MAIL_SERVER = os.environ.get("MAIL_SERVER", "")
+    MAIL_PORT = int(os.environ.get("MAIL_PORT", 25))
+    MAIL_USE_TLS = os.environ.get("MAIL_USE_TLS", "") == "1"
+    MAIL_USERNAME = os.environ.get("MAIL_USERNAME", "")
+    MAIL_PASSWORD = os.environ.get("MAIL_PASSWORD", "")
+    MAIL_SENDER = os.environ.get("MAIL_SENDER", "noreply@example.com")
+    MAIL_RATE = float(os.environ.get("MAIL_RATE", 5))   # 每秒最多发送的邮件数
+    MAIL_BATCH_SIZE = int(os.environ.get("MAIL_BATCH_SIZE", 50))   # 每封邮件的收件人数
+    MAIL_POOL_SIZE = int(os.environ.get("MAIL_POOL_SIZE", 4))   # 发送线程 / SMTP 连接数
+    MAIL_MAX_ATTEMPTS = int(os.environ.get("MAIL_MAX_ATTEMPTS", 5))
+    MAIL_WORKER_INTERVAL = int(os.environ.get("MAIL_WORKER_INTERVAL", 0))   # 进程内发送间隔（秒），0 表示不启用
+
+    # 进程内保养排程间隔（秒），0 表示不启用，改用 flask schedule-maintenance 定时执行
+    MAINTENANCE_SCHEDULER_INTERVAL = int(os.environ.get("MAINTENANCE_SCHEDULER_INTERVAL", 0))
+
+    # 设备分析读取增量维护的年度汇总表（首次启用前执行 flask rebuild-equipment-rollup）
+    EQUIPMENT_ROLLUP = os.environ.get("EQUIPMENT_ROLLUP", "") == "1"
+
+    # 指标与性能分析：/metrics 为 Prometheus 文本格式，需带 Authorization: Bearer <METRICS_TOKEN>；未设置 token 时只在调试、测试模式下可访问
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+    SLOW_QUERY_MS = int(os.environ.get("SLOW_QUERY_MS", 200))   # 超过该耗时的 SQL 记录语句样本
+    PROFILER_TOKEN = os.environ.get("PROFILER_TOKEN", "")   # 请求头 X-Profile 等于该值时对本次请求做 cProfile，为空则不允许
+    PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))   # 随机采样比例，0 表示不采样
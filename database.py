@@ -0,0 +1,96 @@
+import sqlite3
+import time
+from functools import wraps
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+
+REPLICA_BIND = "replica"
+
+class RoutingSession(Session):
+    """标记为只读的请求里，SELECT 走只读副本；flush 和写语句仍走主库"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and getattr(clause, "is_select", False)
+                and has_request_context() and g.get("use_replica")):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def read_only(view):
+    """只读视图：配置了只读副本且本会话最近没有写入时，查询走副本"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        cfg = current_app.config
+        if REPLICA_BIND in (cfg.get("SQLALCHEMY_BINDS") or {}) and request.method in ("GET", "HEAD"):
+            # 写入后的几秒内仍读主库，保证能看到自己刚提交的数据
+            g.use_replica = time.time() - session.get("db_wrote_at", 0) > cfg["REPLICA_STICKY_SECONDS"]
+        return view(*args, **kwargs)
+    return wrapper
+
+def upsert_add(connection, table, key, delta, extra=None):
+    """按唯一键累加汇总行：不存在则插入 key + delta；存在则 delta 中的列加上增量，extra 中的列直接覆盖。
+    PostgreSQL、SQLite 用 INSERT ... ON CONFLICT，其他数据库先 UPDATE，没有命中再 INSERT"""
+    extra = extra or {}
+    increments = {k: table.c[k] + v for k, v in delta.items()}
+    dialect = connection.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        stmt = (postgresql.insert if dialect == "postgresql" else sqlite.insert)(table).values(**key, **delta, **extra)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c[k] for k in key],
+            set_={**{k: table.c[k] + stmt.excluded[k] for k in delta}, **extra},
+        ))
+        return
+    where = [table.c[k] == v for k, v in key.items()]
+    if not connection.execute(update(table).where(*where).values(**increments, **extra)).rowcount:
+        connection.execute(insert(table).values(**key, **delta, **extra))
+
+def upsert_rows(session, model, key, rows):
+    """按唯一键批量写入：key 已存在的行用 rows 中其余列覆盖，否则插入。
+    PostgreSQL、SQLite 用一条 INSERT ... ON CONFLICT 批量执行，其他数据库逐行先 UPDATE，没有命中再 INSERT；
+    走 session.execute，缓存失效等 ORM 事件照常触发"""
+    if not rows:
+        return
+    table = model.__table__
+    columns = [c for c in rows[0] if c not in key]
+    dialect = session.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        stmt = (postgresql.insert if dialect == "postgresql" else sqlite.insert)(model)
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c[k] for k in key],
+            set_={c: stmt.excluded[c] for c in columns},
+        ), rows)
+        return
+    for row in rows:
+        where = [table.c[k] == row[k] for k in key]
+        if not session.execute(update(model).where(*where).values({c: row[c] for c in columns})).rowcount:
+            session.execute(insert(model).values(**row))
+
+# 新建 SQLite 连接时执行的 PRAGMA，由 init_app 按配置填充
+_pragmas = []
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in _pragmas:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+def init_app(app):
+    """SQLite 连接参数；记录写请求时间供只读副本路由使用"""
+    _pragmas[:] = [f"PRAGMA busy_timeout={int(app.config['SQLITE_BUSY_TIMEOUT'])}"]
+    if app.config["SQLITE_WAL"]:
+        # WAL：读写互不阻塞；synchronous=NORMAL 在 WAL 下不会损坏数据库，断电时只可能丢失最后几个事务
+        _pragmas.extend(["PRAGMA journal_mode=WAL", "PRAGMA synchronous=NORMAL"])
+    if not event.contains(Engine, "connect", _sqlite_pragmas):
+        event.listen(Engine, "connect", _sqlite_pragmas)
+
+    @app.after_request
+    def remember_write(response):
+        if request.method not in ("GET", "HEAD", "OPTIONS") and REPLICA_BIND in (app.config.get("SQLALCHEMY_BINDS") or {}):
+            session["db_wrote_at"] = time.time()
+        return response
@@ -0,0 +1,112 @@
+import csv
+import io
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from models import db, Owner, ChargeType, Invoice, Payment, WorkOrder
+
+YIELD_PER = 1000
+
+# (中文表头, 英文表头, 列表达式)，与列表页模板一致
+def _invoice_columns():
+    paid = (select(func.coalesce(func.sum(Payment.amount), 0.0))
+            .where(Payment.invoice_id == Invoice.id).scalar_subquery())
+    return [
+        ("ID", "ID", Invoice.id),
+        ("业主", "Owner", Owner.name),
+        ("费用名称", "Charge Name", func.coalesce(ChargeType.name, Invoice.description)),
+        ("计费周期", "Billing Cycle", Invoice.billing_cycle),
+        ("单价", "Unit Price", Invoice.price),
+        ("费用金额(月)", "Amount (Month)", Invoice.amount),
+        ("已缴费", "Paid", paid),
+        ("还需缴费", "Remaining", Invoice.unpaid_amount),
+        ("到期日", "Due Date", Invoice.due_date),
+        ("支付状态", "Status", Invoice.status),
+    ]
+
+def _payment_columns():
+    return [
+        ("ID", "ID", Payment.id),
+        ("时间", "Time", Payment.paid_at),
+        ("业主", "Owner", Owner.name),
+        ("关联账单", "Invoice", Payment.invoice_id),
+        ("金额", "Amount", Payment.amount),
+        ("方式", "Method", Payment.method),
+        ("备注", "Note", Payment.note),
+    ]
+
+def _workorder_columns():
+    return [
+        ("ID", "ID", WorkOrder.id),
+        ("类型", "Type", WorkOrder.type),
+        ("状态", "Status", WorkOrder.status),
+        ("优先级", "Priority", WorkOrder.priority),
+        ("描述", "Description", WorkOrder.description),
+        ("创建时间", "Created", WorkOrder.created_at),
+    ]
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+def _date_range(column, start, end, is_datetime=False):
+    """[start, end] 闭区间；日期时间列的 end 取次日零点之前"""
+    clauses = []
+    if start:
+        clauses.append(column >= start)
+    if end:
+        clauses.append(column < end + timedelta(days=1) if is_datetime else column <= end)
+    return clauses
+
+def invoice_export(status=None, start=None, end=None):
+    columns = _invoice_columns()
+    stmt = (select(*[c for _, _, c in columns])
+            .join(Owner, Invoice.owner_id == Owner.id)
+            .outerjoin(ChargeType, Invoice.charge_type_id == ChargeType.id)
+            .where(*_date_range(Invoice.due_date, _parse_date(start), _parse_date(end)))
+            .order_by(Invoice.due_date, Invoice.id))
+    if status:
+        stmt = stmt.where(Invoice.status == status)
+    return columns, stmt
+
+def payment_export(status=None, start=None, end=None):
+    columns = _payment_columns()
+    stmt = (select(*[c for _, _, c in columns])
+            .join(Owner, Payment.owner_id == Owner.id)
+            .where(*_date_range(Payment.paid_at, _parse_date(start), _parse_date(end), is_datetime=True))
+            .order_by(Payment.paid_at.desc(), Payment.id.desc()))
+    if status:
+        # 按关联账单的支付状态筛选
+        stmt = stmt.join(Invoice, Payment.invoice_id == Invoice.id).where(Invoice.status == status)
+    return columns, stmt
+
+def workorder_export(status=None, start=None, end=None):
+    columns = _workorder_columns()
+    stmt = (select(*[c for _, _, c in columns])
+            .where(*_date_range(WorkOrder.created_at, _parse_date(start), _parse_date(end), is_datetime=True))
+            .order_by(WorkOrder.created_at.desc(), WorkOrder.id.desc()))
+    if status:
+        stmt = stmt.where(WorkOrder.status == status)
+    return columns, stmt
+
+def _format(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M')
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return value
+
+def stream_csv(columns, stmt, lang='zh'):
+    """逐批读取（服务端游标）并逐行输出 CSV，内存占用与行数无关"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    buf.write('\ufeff')   # Excel 识别 UTF-8
+    writer.writerow([en if lang == 'en' else zh for zh, en, _ in columns])
+    result = db.session.execute(stmt.execution_options(yield_per=YIELD_PER))
+    for partition in result.partitions():
+        for row in partition:
+            writer.writerow([_format(v) for v in row])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()
@@ -0,0 +1,134 @@
+import csv
+import io
+import json
+import math
+import re
+import time
+from sqlalchemy.exc import SQLAlchemyError
+from database import upsert_rows
+from models import db, Owner
+from parking import sync_owners
+
+# 表头支持中英文
+COLUMNS = {
+    "name": "name", "姓名": "name",
+    "phone": "phone", "电话": "phone",
+    "email": "email", "邮箱": "email",
+    "unit": "unit", "房产": "unit",
+    "area": "area", "面积": "area", "房屋面积(㎡)": "area",
+    "unit_type": "unit_type", "房型": "unit_type",
+    "vehicles": "vehicles", "车辆": "vehicles", "车辆详情": "vehicles",
+    "parking_spots": "parking_spots", "车位": "parking_spots", "车位编号": "parking_spots",
+}
+UNIT_RE = re.compile(r"^[A-Z0-9]+(-[A-Z0-9]+){1,3}$")
+PHONE_RE = re.compile(r"^\+?[0-9][0-9\- ]{4,19}$")
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+def _normalize_header(header):
+    return [COLUMNS.get((h or "").strip().lower(), COLUMNS.get((h or "").strip())) for h in header]
+
+def _iter_csv(stream):
+    reader = csv.reader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+    header = _normalize_header(next(reader, []))
+    for rownum, values in enumerate(reader, start=2):
+        if any(v.strip() for v in values):
+            yield rownum, {k: v for k, v in zip(header, values) if k}
+
+def _iter_xlsx(stream):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("导入 XLSX 需要安装 openpyxl")
+    # read_only 模式逐行读取，不把整个工作簿载入内存
+    wb = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = _normalize_header([str(h) if h is not None else "" for h in next(rows, [])])
+        for rownum, values in enumerate(rows, start=2):
+            cells = ["" if v is None else str(v) for v in values]
+            if any(c.strip() for c in cells):
+                yield rownum, {k: v for k, v in zip(header, cells) if k}
+    finally:
+        wb.close()
+
+def iter_rows(stream, filename):
+    """按行读取上传文件，产出 (行号, {字段: 值})"""
+    if filename.lower().endswith(".xlsx"):
+        return _iter_xlsx(stream)
+    if filename.lower().endswith(".csv"):
+        return _iter_csv(stream)
+    raise ValueError("只支持 CSV 或 XLSX 文件")
+
+def validate_row(raw):
+    """校验并转换一行，返回 (数据, 错误列表)"""
+    errors = []
+    data = {k: (raw.get(k) or "").strip() for k in ("name", "phone", "email", "unit", "unit_type", "parking_spots")}
+    if not data["name"]:
+        errors.append("姓名为空")
+    data["unit"] = data["unit"].upper()
+    if not UNIT_RE.match(data["unit"]):
+        errors.append(f"房产格式错误：{data['unit'] or '空'}（如 A-2-302）")
+    if data["phone"] and not PHONE_RE.match(data["phone"]):
+        errors.append(f"电话格式错误：{data['phone']}")
+    if data["email"] and not EMAIL_RE.match(data["email"]):
+        errors.append(f"邮箱格式错误：{data['email']}")
+    try:
+        data["area"] = float(raw.get("area") or 0)
+        if not math.isfinite(data["area"]) or data["area"] < 0:
+            raise ValueError
+    except ValueError:
+        errors.append(f"面积错误：{raw.get('area')}")
+    vehicles = (raw.get("vehicles") or "").strip() or "[]"
+    try:
+        parsed = json.loads(vehicles)
+        if not isinstance(parsed, list) or not all(isinstance(v, dict) and str(v.get("plate", "")).strip() for v in parsed):
+            raise ValueError
+        data["vehicles"] = json.dumps(parsed, ensure_ascii=False)
+    except ValueError:
+        errors.append("车辆详情应为 JSON 列表，如 [{\"plate\":\"沪A12345\",\"model\":\"Tesla 3\"}]")
+    data["parking_spots"] = ",".join(s.strip() for s in re.split(r"[,，;；]", data["parking_spots"]) if s.strip())
+    for key in ("phone", "email", "unit_type", "parking_spots"):
+        data[key] = data[key] or None
+    return data, errors
+
+def _flush(batch, report):
+    """一批一个事务：按 unit（唯一索引）已存在则更新，否则插入；并发导入同一房产也只会有一条"""
+    existing = {unit for (unit,) in db.session.query(Owner.unit).filter(Owner.unit.in_(batch.keys()))}
+    updated = sum(1 for unit in batch if unit in existing)   # 只用于统计，写入以唯一索引为准
+    try:
+        upsert_rows(db.session, Owner, ["unit"], [row for _, row in batch.values()])
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        for unit, (rownum, _) in batch.items():
+            report["errors"].append({"row": rownum, "unit": unit, "errors": [f"写入失败：{e.__class__.__name__}"]})
+        return
+    report["updated"] += updated
+    report["created"] += len(batch) - updated
+    # 同步车辆、车位表（并更新 vehicle_count）
+    units = {oid: unit for oid, unit in db.session.query(Owner.id, Owner.unit).filter(Owner.unit.in_(batch.keys()))}
+    for owner_id, key in sync_owners(units)["conflicts"]:
+        unit = units[owner_id]
+        report["errors"].append({"row": batch[unit][0], "unit": unit, "errors": [f"车牌/车位已被其他业主登记：{key}"]})
+    db.session.commit()
+
+def import_owners(rows, batch_size=1000):
+    """导入业主；rows 为 iter_rows 产出的迭代器，返回汇总与逐行错误"""
+    report = {"rows": 0, "created": 0, "updated": 0, "errors": [], "seconds": 0.0}
+    began = time.perf_counter()
+    batch = {}
+    for rownum, raw in rows:
+        report["rows"] += 1
+        data, errors = validate_row(raw)
+        if errors:
+            report["errors"].append({"row": rownum, "unit": data["unit"], "errors": errors})
+            continue
+        # 同一批内重复的房产以最后一行为准
+        batch[data["unit"]] = (rownum, data)
+        if len(batch) >= batch_size:
+            _flush(batch, report)
+            batch = {}
+    if batch:
+        _flush(batch, report)
+    report["seconds"] = time.perf_counter() - began
+    return report
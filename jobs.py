@@ -0,0 +1,16 @@
+import threading
+
+def start_periodic(app, name, interval, job):
+    """在后台线程中每 interval 秒执行一次 job（在应用上下文内），返回用于停止的 Event"""
+    stopped = threading.Event()
+
+    def run():
+        while not stopped.wait(interval):
+            with app.app_context():
+                try:
+                    job()
+                except Exception:
+                    app.logger.exception("定时任务 %s 执行失败", name)
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+    return stopped
@@ -0,0 +1,74 @@
+from datetime import datetime
+from sqlalchemy import event, exists, func, insert, literal, select, update
+from database import upsert_add
+from models import db, Invoice, Payment, OwnerAccount
+
+BATCH = 2000
+
+def _post(connection, owner_id, billed=0.0, paid=0.0):
+    """在当前事务内累加业主账户，不存在则创建"""
+    if owner_id is None or not (billed or paid):
+        return
+    upsert_add(connection, OwnerAccount.__table__, {"owner_id": owner_id},
+               {"total_billed": billed, "total_paid": paid, "balance": billed - paid},
+               {"updated_at": datetime.utcnow()})
+
+@event.listens_for(Invoice, "after_insert")
+def _invoice_inserted(mapper, connection, target):
+    _post(connection, target.owner_id, billed=target.amount or 0.0)
+
+@event.listens_for(Invoice, "after_delete")
+def _invoice_deleted(mapper, connection, target):
+    _post(connection, target.owner_id, billed=-(target.amount or 0.0))
+
+@event.listens_for(Payment, "after_insert")
+def _payment_inserted(mapper, connection, target):
+    _post(connection, target.owner_id, paid=target.amount or 0.0)
+
+@event.listens_for(Payment, "after_delete")
+def _payment_deleted(mapper, connection, target):
+    _post(connection, target.owner_id, paid=-(target.amount or 0.0))
+
+def post_billed(*criteria):
+    """INSERT ... SELECT 批量出账后调用：把满足条件的账单计入账户，与出账同一事务"""
+    billed = (select(func.sum(Invoice.amount))
+              .where(Invoice.owner_id == OwnerAccount.owner_id, *criteria)
+              .scalar_subquery())
+    owners = select(Invoice.owner_id).where(*criteria)
+    now = datetime.utcnow()
+    db.session.execute(
+        insert(OwnerAccount).from_select(
+            ["owner_id", "total_billed", "total_paid", "balance", "updated_at"],
+            select(Invoice.owner_id, literal(0.0), literal(0.0), literal(0.0), literal(now)).where(*criteria)
+            .where(~exists().where(OwnerAccount.owner_id == Invoice.owner_id))
+            .group_by(Invoice.owner_id)
+        )
+    )
+    db.session.execute(
+        update(OwnerAccount)
+        .where(OwnerAccount.owner_id.in_(owners))
+        .values(total_billed=OwnerAccount.total_billed + billed, balance=OwnerAccount.balance + billed, updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+
+def reconcile_accounts():
+    """按账单、缴费全量重建业主账户，返回账户数与对账前不一致的账户数"""
+    billed = dict(db.session.query(Invoice.owner_id, func.sum(Invoice.amount)).group_by(Invoice.owner_id))
+    paid = dict(db.session.query(Payment.owner_id, func.sum(Payment.amount)).group_by(Payment.owner_id))
+    current = {oid: (b, p) for oid, b, p in
+               db.session.query(OwnerAccount.owner_id, OwnerAccount.total_billed, OwnerAccount.total_paid)}
+    now = datetime.utcnow()
+    rows, mismatched = [], 0
+    for owner_id in sorted(billed.keys() | paid.keys()):
+        total_billed, total_paid = billed.get(owner_id) or 0.0, paid.get(owner_id) or 0.0
+        old = current.pop(owner_id, None)
+        if old is None or round(old[0] - total_billed, 2) or round(old[1] - total_paid, 2):
+            mismatched += 1
+        rows.append(dict(owner_id=owner_id, total_billed=total_billed, total_paid=total_paid,
+                         balance=total_billed - total_paid, updated_at=now))
+    mismatched += len(current)   # 没有任何账单、缴费却有账户记录
+    db.session.execute(OwnerAccount.__table__.delete())
+    for start in range(0, len(rows), BATCH):
+        db.session.execute(insert(OwnerAccount), rows[start:start + BATCH])
+    db.session.commit()
+    return {"accounts": len(rows), "mismatched": mismatched}
@@ -0,0 +1,212 @@
+import smtplib
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from sqlalchemy import func, literal, exists, insert, select, update
+from models import db, Owner, Announcement, EmailOutbox
+
+# 发送中超过该时间视为 worker 已退出，重新放回队列
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+def enqueue_announcement(ann):
+    """把公告写入发件箱：每个有邮箱的业主一行，同一邮箱只发一次；不提交，由调用方与公告一起提交"""
+    rows = (select(literal(ann.id), func.min(Owner.id), Owner.email, literal("待发送"), literal(0), literal(datetime.utcnow()))
+            .where(Owner.email.isnot(None), Owner.email != "")
+            .where(~exists().where((EmailOutbox.announcement_id == ann.id) & (EmailOutbox.email == Owner.email)))
+            .group_by(Owner.email))
+    result = db.session.execute(
+        insert(EmailOutbox).from_select(
+            ["announcement_id", "owner_id", "email", "status", "attempts", "next_attempt_at"], rows)
+    )
+    return result.rowcount
+
+def delivery_counts(announcement_ids):
+    """{公告 ID: {状态: 数量}}"""
+    counts = {}
+    if not announcement_ids:
+        return counts
+    rows = (db.session.query(EmailOutbox.announcement_id, EmailOutbox.status, func.count())
+            .filter(EmailOutbox.announcement_id.in_(announcement_ids))
+            .group_by(EmailOutbox.announcement_id, EmailOutbox.status))
+    for ann_id, status, n in rows:
+        counts.setdefault(ann_id, {})[status] = n
+    return counts
+
+class RateLimiter:
+    """所有发送线程共享的限速器，rate 为每秒消息数"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+class SMTPPool:
+    """每个发送线程复用一条 SMTP 连接"""
+
+    def __init__(self, config):
+        self.config = config
+        self._local = threading.local()
+        self._all = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        cfg = self.config
+        conn = smtplib.SMTP(cfg["MAIL_SERVER"], cfg["MAIL_PORT"], timeout=30)
+        if cfg.get("MAIL_USE_TLS"):
+            conn.starttls()
+        if cfg.get("MAIL_USERNAME"):
+            conn.login(cfg["MAIL_USERNAME"], cfg["MAIL_PASSWORD"])
+        with self._lock:
+            self._all.append(conn)
+        return conn
+
+    def send(self, sender, recipients, message):
+        """返回被拒收的 {邮箱: 原因}；连接断开时重连一次"""
+        conn = getattr(self._local, "conn", None)
+        for retry in (False, True):
+            if conn is None:
+                conn = self._local.conn = self._connect()
+            try:
+                refused = conn.sendmail(sender, recipients, message.as_string())
+                return {rcpt: f"{code} {msg.decode(errors='replace') if isinstance(msg, bytes) else msg}"
+                        for rcpt, (code, msg) in refused.items()}
+            except smtplib.SMTPRecipientsRefused as e:
+                return {rcpt: f"{code} {msg}" for rcpt, (code, msg) in e.recipients.items()}
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                if retry:
+                    raise
+                conn = self._local.conn = None
+
+    def close(self):
+        with self._lock:
+            for conn in self._all:
+                try:
+                    conn.quit()
+                except (smtplib.SMTPException, OSError):
+                    pass
+            self._all.clear()
+
+def _build_message(config, ann):
+    msg = EmailMessage()
+    msg["Subject"] = ann.title
+    msg["From"] = config["MAIL_SENDER"]
+    msg["To"] = config.get("MAIL_TO_HEADER") or "undisclosed-recipients:;"   # 收件人走信封，不暴露给其他业主
+    msg.set_content(ann.content)
+    return msg
+
+def _claim(batch_size):
+    """原子领取一批待发送记录，多个 worker 并发时不会重复发送"""
+    now = datetime.utcnow()
+    db.session.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.status == "发送中", EmailOutbox.claimed_at < now - CLAIM_TIMEOUT)
+        .values(status="待发送", claim_token=None)
+        .execution_options(synchronize_session=False)
+    )
+    ids = [i for (i,) in db.session.query(EmailOutbox.id)
+           .filter(EmailOutbox.status == "待发送", EmailOutbox.next_attempt_at <= now)
+           .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+           .limit(batch_size)]
+    if not ids:
+        db.session.commit()
+        return None, []
+    token = uuid.uuid4().hex
+    db.session.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.id.in_(ids), EmailOutbox.status == "待发送")
+        .values(status="发送中", claim_token=token, claimed_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    rows = (db.session.query(EmailOutbox.id, EmailOutbox.announcement_id, EmailOutbox.email)
+            .filter(EmailOutbox.claim_token == token).all())
+    return token, rows
+
+def _record(results, max_attempts):
+    """在主线程写回每个收件人的发送结果"""
+    now = datetime.utcnow()
+    sent, failed = [], []
+    for outbox_id, error in results:
+        if error is None:
+            sent.append(outbox_id)
+        else:
+            failed.append((outbox_id, error))
+    if sent:
+        db.session.execute(
+            update(EmailOutbox).where(EmailOutbox.id.in_(sent))
+            .values(status="已发送", sent_at=now, attempts=EmailOutbox.attempts + 1, claim_token=None, last_error=None)
+            .execution_options(synchronize_session=False)
+        )
+    for outbox_id, error in failed:
+        row = db.session.get(EmailOutbox, outbox_id)
+        row.attempts = (row.attempts or 0) + 1
+        row.last_error = error[:255]
+        row.claim_token = None
+        # 5xx 拒收为永久错误，不再重试
+        if row.attempts >= max_attempts or error.startswith("5"):
+            row.status = "失败"
+        else:
+            # 指数退避：1, 2, 4, 8... 分钟
+            row.status = "待发送"
+            row.next_attempt_at = now + timedelta(minutes=2 ** (row.attempts - 1))
+    db.session.commit()
+    return len(sent), len(failed)
+
+def deliver_pending(config, max_rows=None):
+    """发送发件箱中到期的邮件，直到队列为空或达到 max_rows；返回统计"""
+    if not config.get("MAIL_SERVER"):
+        raise RuntimeError("未配置 MAIL_SERVER")
+    batch_size = config.get("MAIL_BATCH_SIZE", 50)
+    pool_size = config.get("MAIL_POOL_SIZE", 4)
+    limiter = RateLimiter(config.get("MAIL_RATE", 5))
+    smtp = SMTPPool(config)
+    stats = {"sent": 0, "failed": 0, "messages": 0}
+    messages = {}
+
+    def send_batch(ann_id, recipients):
+        limiter.wait()
+        try:
+            refused = smtp.send(config["MAIL_SENDER"], [email for _, email in recipients], messages[ann_id])
+        except (smtplib.SMTPException, OSError) as e:
+            return [(oid, f"{e.__class__.__name__}: {e}") for oid, _ in recipients]
+        return [(oid, refused.get(email)) for oid, email in recipients]
+
+    try:
+        with ThreadPoolExecutor(max_workers=pool_size) as executor:
+            while max_rows is None or stats["sent"] + stats["failed"] < max_rows:
+                # 每轮领取 pool_size 个批次，每个批次是一封多收件人邮件
+                token, rows = _claim(batch_size * pool_size)
+                if not rows:
+                    break
+                by_ann = {}
+                for oid, ann_id, email in rows:
+                    by_ann.setdefault(ann_id, []).append((oid, email))
+                for ann_id in by_ann:
+                    if ann_id not in messages:
+                        messages[ann_id] = _build_message(config, db.session.get(Announcement, ann_id))
+                batches = [(ann_id, recipients[i:i + batch_size])
+                           for ann_id, recipients in by_ann.items()
+                           for i in range(0, len(recipients), batch_size)]
+                results = []
+                for batch_result in executor.map(lambda b: send_batch(*b), batches):
+                    results.extend(batch_result)
+                stats["messages"] += len(batches)
+                sent, failed = _record(results, config.get("MAIL_MAX_ATTEMPTS", 5))
+                stats["sent"] += sent
+                stats["failed"] += failed
+    finally:
+        smtp.close()
+    return stats
@@ -0,0 +1,121 @@
+import re
+from datetime import date, datetime
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import insert, text, update
+from models import db, Equipment, MaintenancePlan, WorkOrder
+
+FREQUENCIES = {
+    "每天": relativedelta(days=1), "每日": relativedelta(days=1), "daily": relativedelta(days=1),
+    "每周": relativedelta(weeks=1), "weekly": relativedelta(weeks=1),
+    "每两周": relativedelta(weeks=2),
+    "每月": relativedelta(months=1), "monthly": relativedelta(months=1),
+    "每两个月": relativedelta(months=2), "每双月": relativedelta(months=2),
+    "每季度": relativedelta(months=3), "每季": relativedelta(months=3), "quarterly": relativedelta(months=3),
+    "每半年": relativedelta(months=6), "semiannually": relativedelta(months=6),
+    "每年": relativedelta(years=1), "yearly": relativedelta(years=1), "annually": relativedelta(years=1),
+}
+_EVERY_N = re.compile(r"^每\s*(\d+)\s*(天|日|周|个月|月|年)$")
+_UNITS = {"天": "days", "日": "days", "周": "weeks", "个月": "months", "月": "months", "年": "years"}
+
+# PostgreSQL advisory lock 的键，多个 worker 只有一个能执行排程
+LOCK_KEY = 0x504D4D50
+
+def frequency_delta(frequency):
+    """'每季度' -> relativedelta(months=3)，无法识别返回 None"""
+    value = (frequency or "").strip()
+    if value.lower() in FREQUENCIES:
+        return FREQUENCIES[value.lower()]
+    m = _EVERY_N.match(value)
+    if m and int(m.group(1)) > 0:
+        return relativedelta(**{_UNITS[m.group(2)]: int(m.group(1))})
+    return None
+
+def occurrences(anchor, delta, start):
+    """排程日期 anchor + delta × n（n ≥ 0）中不早于 start 的各次，依次产出；
+    每次都从 anchor 计算，1 月 31 日起的每月计划为 2 月 28 日、3 月 31 日，而不是 3 月 28 日"""
+    n = 0
+    while True:
+        when = anchor + delta * n
+        if when >= start:
+            yield when
+        n += 1
+
+def _acquire_lock():
+    """PostgreSQL 使用事务级 advisory lock；其他数据库依赖下面的条件更新防止重复"""
+    if db.engine.dialect.name == "postgresql":
+        return db.session.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": LOCK_KEY}).scalar()
+    return True
+
+def run_due_plans(today=None):
+    """为到期的保养计划批量创建工单并推进 next_date，返回统计"""
+    today = today or date.today()
+    stats = {"due": 0, "created": 0, "skipped": [], "locked": False}
+    if not _acquire_lock():
+        db.session.rollback()
+        stats["locked"] = True
+        return stats
+
+    due = (db.session.query(MaintenancePlan.id, MaintenancePlan.equipment_id, MaintenancePlan.frequency,
+                            MaintenancePlan.next_date, MaintenancePlan.anchor_date, MaintenancePlan.notes, Equipment.name)
+           .join(Equipment, MaintenancePlan.equipment_id == Equipment.id)
+           .filter(MaintenancePlan.next_date <= today)
+           .order_by(MaintenancePlan.next_date)
+           .all())
+    stats["due"] = len(due)
+    now = datetime.utcnow()
+    workorders = []
+    for plan_id, equipment_id, frequency, next_date, anchor_date, notes, equipment_name in due:
+        delta = frequency_delta(frequency)
+        if delta is None:
+            stats["skipped"].append(plan_id)
+            continue
+        # 错过多个周期时只建一张工单，next_date 推进到今天之后
+        anchor = anchor_date or next_date
+        new_date = next(occurrences(anchor, delta, today + relativedelta(days=1)))
+        claimed = db.session.execute(
+            update(MaintenancePlan)
+            .where(MaintenancePlan.id == plan_id, MaintenancePlan.next_date == next_date)
+            .values(next_date=new_date, anchor_date=anchor)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not claimed:
+            continue   # 已被其他 worker 处理
+        workorders.append(dict(
+            type="维修", status="新建", priority="中", created_at=now, equipment_id=equipment_id,
+            description=f"定期保养：{equipment_name}（{frequency}，计划日期 {next_date}）" + (f" {notes}" if notes else ""),
+        ))
+    if workorders:
+        db.session.execute(insert(WorkOrder), workorders)
+    db.session.commit()
+    stats["created"] = len(workorders)
+    return stats
+
+def forecast(months=12, today=None):
+    """不写库，预测未来 months 个月每月的保养工单数量：[(YYYY-MM, 总数, {设备类型: 数量})]"""
+    today = today or date.today()
+    start = today.replace(day=1)
+    end = start + relativedelta(months=months)
+    buckets = {(start + relativedelta(months=i)).strftime("%Y-%m"): {} for i in range(months)}
+    plans = (db.session.query(MaintenancePlan.frequency, MaintenancePlan.next_date, MaintenancePlan.anchor_date,
+                              Equipment.equipment_type)
+             .join(Equipment, MaintenancePlan.equipment_id == Equipment.id)
+             .filter(MaintenancePlan.next_date.isnot(None), MaintenancePlan.next_date < end))
+    for frequency, next_date, anchor_date, equipment_type in plans:
+        delta = frequency_delta(frequency)
+        if delta is None:
+            continue
+        key = equipment_type or "其他"
+        dates = []
+        start = next_date
+        if next_date < today:
+            # 与 run_due_plans 一致：逾期计划今天建一张工单，再推进到今天之后
+            dates.append(today)
+            start = today + relativedelta(days=1)
+        for when in occurrences(anchor_date or next_date, delta, start):
+            if when >= end:
+                break
+            dates.append(when)
+        for when in dates:
+            counts = buckets[when.strftime("%Y-%m")]
+            counts[key] = counts.get(key, 0) + 1
+    return [(month, sum(counts.values()), counts) for month, counts in buckets.items()]
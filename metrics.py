@@ -0,0 +1,140 @@
+import cProfile
+import io
+import pstats
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 请求耗时直方图的桶上界（秒），与 Prometheus 客户端默认值一致
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Metrics:
+    """进程内指标；gunicorn 多 worker 时每个 worker 各自统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}   # (endpoint, method, status) -> 次数
+        self.latency = {}   # (endpoint, method) -> [各桶计数..., 总和, 总数]
+        self.sql = {}   # endpoint -> [语句数, 耗时秒数]
+        self.slow = {}   # endpoint -> 慢查询次数
+        self.slow_samples = deque(maxlen=50)
+        self.profiles = deque(maxlen=20)
+
+    def observe_request(self, endpoint, method, status, seconds, sql_count, sql_seconds):
+        with self._lock:
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            hist = self.latency.setdefault((endpoint, method), [0] * (len(BUCKETS) + 2))
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    hist[i] += 1
+            hist[-2] += seconds
+            hist[-1] += 1
+            totals = self.sql.setdefault(endpoint, [0, 0.0])
+            totals[0] += sql_count
+            totals[1] += sql_seconds
+
+    def observe_slow_query(self, endpoint, statement, seconds):
+        with self._lock:
+            self.slow[endpoint] = self.slow.get(endpoint, 0) + 1
+            self.slow_samples.append({
+                "endpoint": endpoint, "seconds": round(seconds, 4), "statement": statement[:2000],
+                "at": datetime.utcnow().isoformat(timespec="seconds"),
+            })
+
+    def render(self):
+        """Prometheus 文本格式"""
+        lines = []
+        with self._lock:
+            lines += ["# HELP pm_requests_total HTTP requests by endpoint and status.", "# TYPE pm_requests_total counter"]
+            for (endpoint, method, status), n in sorted(self.requests.items()):
+                lines.append(f'pm_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {n}')
+            lines += ["# HELP pm_request_duration_seconds Request latency.", "# TYPE pm_request_duration_seconds histogram"]
+            for (endpoint, method), hist in sorted(self.latency.items()):
+                labels = f'endpoint="{endpoint}",method="{method}"'
+                for bound, n in zip(BUCKETS, hist):
+                    lines.append(f'pm_request_duration_seconds_bucket{{{labels},le="{bound}"}} {n}')
+                lines.append(f'pm_request_duration_seconds_bucket{{{labels},le="+Inf"}} {hist[-1]}')
+                lines.append(f'pm_request_duration_seconds_sum{{{labels}}} {hist[-2]:.6f}')
+                lines.append(f'pm_request_duration_seconds_count{{{labels}}} {hist[-1]}')
+            lines += ["# HELP pm_sql_statements_total SQL statements executed while serving requests.",
+                      "# TYPE pm_sql_statements_total counter"]
+            lines += [f'pm_sql_statements_total{{endpoint="{e}"}} {n}' for e, (n, _) in sorted(self.sql.items())]
+            lines += ["# HELP pm_sql_seconds_total Time spent in SQL while serving requests.", "# TYPE pm_sql_seconds_total counter"]
+            lines += [f'pm_sql_seconds_total{{endpoint="{e}"}} {s:.6f}' for e, (_, s) in sorted(self.sql.items())]
+            lines += ["# HELP pm_slow_queries_total SQL statements slower than SLOW_QUERY_MS.", "# TYPE pm_slow_queries_total counter"]
+            lines += [f'pm_slow_queries_total{{endpoint="{e}"}} {n}' for e, n in sorted(self.slow.items())]
+        return "\n".join(lines) + "\n"
+
+    def profile(self, profile_id):
+        for item in self.profiles:
+            if item["id"] == profile_id:
+                return item
+        return None
+
+registry = Metrics()
+
+def _endpoint():
+    return request.endpoint or "unmatched"
+
+# 语句条数由 querybudget 统计（g.sql_statements），这里只计时
+def _before_cursor(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+def _after_cursor(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("metrics_started")
+    if not started:
+        return
+    seconds = time.perf_counter() - started.pop()
+    if not has_request_context() or "metrics_started" not in g:
+        return
+    g.metrics_sql_seconds += seconds
+    if seconds * 1000 >= g.metrics_slow_ms:
+        registry.observe_slow_query(_endpoint(), statement, seconds)
+
+def init_app(app):
+    """请求耗时、SQL 条数/耗时、慢查询采样；按请求头或采样率对单个请求做 cProfile"""
+    if not app.config.get("METRICS_ENABLED"):
+        return
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor):
+        event.listen(Engine, "before_cursor_execute", _before_cursor)
+        event.listen(Engine, "after_cursor_execute", _after_cursor)
+
+    @app.before_request
+    def start_metrics():
+        g.metrics_started = time.perf_counter()
+        g.metrics_sql_seconds = 0.0
+        g.metrics_slow_ms = app.config["SLOW_QUERY_MS"]
+        token = app.config.get("PROFILER_TOKEN")
+        requested = bool(token) and request.headers.get("X-Profile") == token
+        sampled = random.random() < app.config.get("PROFILE_SAMPLE_RATE", 0)
+        if requested or sampled:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                return   # 同一进程内已有其他线程在做 profile
+            g.profiler = profiler
+
+    @app.after_request
+    def record_metrics(response):
+        if "metrics_started" not in g:
+            return response
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(40)
+            profile_id = uuid.uuid4().hex[:12]
+            registry.profiles.append({"id": profile_id, "path": request.full_path, "stats": out.getvalue(),
+                                     "at": datetime.utcnow().isoformat(timespec="seconds")})
+            response.headers["X-Profile-Id"] = profile_id
+        registry.observe_request(_endpoint(), request.method, response.status_code,
+                                time.perf_counter() - g.metrics_started, g.get("sql_statements", 0), g.metrics_sql_seconds)
+        return response
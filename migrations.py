@@ -0,0 +1,214 @@
+from datetime import datetime
+from sqlalchemy import (Column, Date, DateTime, Float, ForeignKey, Index, Integer, MetaData, String, Table, Text,
+                        UniqueConstraint, func, inspect, select, text)
+from models import db
+
+# 已执行的迁移版本；init-db 建表后直接记为最新版本
+schema_version = db.Table(
+    "schema_version",
+    db.Column("version", db.Integer, primary_key=True),
+    db.Column("name", db.String(120), nullable=False),
+    db.Column("applied_at", db.DateTime, default=datetime.utcnow),
+)
+
+def _existing_indexes(inspector, table):
+    names = {ix["name"] for ix in inspector.get_indexes(table)}
+    names.update(uq["name"] for uq in inspector.get_unique_constraints(table))
+    return names
+
+def _stubs(metadata, *tables):
+    """迁移里外键引用的已有表，只声明主键，不会被创建"""
+    for name in tables:
+        Table(name, metadata, Column("id", Integer, primary_key=True))
+
+# 每个版本的表结构在这里冻结，之后模型再改也不影响已发布的迁移
+_v1 = MetaData()
+_stubs(_v1, "owner", "announcement", "equipment")
+_v1_tables = [
+    Table("owner_account", _v1,
+          Column("owner_id", Integer, ForeignKey("owner.id"), primary_key=True),
+          Column("total_billed", Float, nullable=False),
+          Column("total_paid", Float, nullable=False),
+          Column("balance", Float, nullable=False),
+          Column("updated_at", DateTime),
+          Index("ix_owner_account_balance", "balance", "owner_id")),
+    Table("vehicle", _v1,
+          Column("id", Integer, primary_key=True),
+          Column("owner_id", Integer, ForeignKey("owner.id"), nullable=False),
+          Column("plate", String(20), nullable=False),
+          Column("model", String(120)),
+          UniqueConstraint("plate", name="uq_vehicle_plate"),
+          Index("ix_vehicle_owner_id", "owner_id")),
+    Table("parking_spot", _v1,
+          Column("id", Integer, primary_key=True),
+          Column("owner_id", Integer, ForeignKey("owner.id"), nullable=False),
+          Column("spot_number", String(20), nullable=False),
+          UniqueConstraint("spot_number", name="uq_parking_spot_number"),
+          Index("ix_parking_spot_owner_id", "owner_id")),
+    Table("email_outbox", _v1,
+          Column("id", Integer, primary_key=True),
+          Column("announcement_id", Integer, ForeignKey("announcement.id"), nullable=False),
+          Column("owner_id", Integer, ForeignKey("owner.id")),
+          Column("email", String(120), nullable=False),
+          Column("status", String(20)),
+          Column("attempts", Integer),
+          Column("last_error", String(255)),
+          Column("next_attempt_at", DateTime),
+          Column("claim_token", String(32)),
+          Column("claimed_at", DateTime),
+          Column("sent_at", DateTime),
+          Column("created_at", DateTime),
+          UniqueConstraint("announcement_id", "email", name="uq_email_outbox_announcement_email"),
+          Index("ix_email_outbox_status_next", "status", "next_attempt_at"),
+          Index("ix_email_outbox_claim_token", "claim_token")),
+    Table("equipment_cost_rollup", _v1,
+          Column("id", Integer, primary_key=True),
+          Column("equipment_id", Integer, ForeignKey("equipment.id"), nullable=False),
+          Column("year", Integer, nullable=False),
+          Column("repairs", Integer),
+          Column("replacements", Integer),
+          Column("total_cost", Float),
+          UniqueConstraint("equipment_id", "year", name="uq_equipment_cost_rollup_equipment_year")),
+    Table("work_order_sla_daily", _v1,
+          Column("id", Integer, primary_key=True),
+          Column("day", Date, nullable=False),
+          Column("repairer", String(120), nullable=False),
+          Column("type", String(50), nullable=False),
+          Column("priority", String(20), nullable=False),
+          Column("completed", Integer),
+          Column("satisfied", Integer),
+          Column("dissatisfied", Integer),
+          Column("response_hist", Text),
+          Column("resolution_hist", Text),
+          UniqueConstraint("day", "repairer", "type", "priority", name="uq_work_order_sla_daily_key")),
+]
+
+_v4 = MetaData()
+period_summary = Table("period_summary", _v4,
+    Column("id", Integer, primary_key=True),
+    Column("period", String(7), nullable=False),
+    Column("charge_type_id", Integer, nullable=False),
+    Column("building", String(20), nullable=False),
+    Column("billed", Float),
+    Column("collected", Float),
+    Column("invoices", Integer),
+    Column("payments", Integer),
+    UniqueConstraint("period", "charge_type_id", "building", name="uq_period_summary_key"),
+)
+
+def create_tables(connection):
+    """这些表（账户汇总、车辆/车位、邮件队列、设备与工单汇总）此前只能靠 init-db 重建"""
+    for table in _v1_tables:
+        table.create(connection, checkfirst=True)
+
+def add_columns(connection):
+    for table, column, type_ in [("invoice", "period", String(7)), ("invoice", "updated_at", DateTime()),
+                                 ("work_order", "updated_at", DateTime()), ("payment", "idempotency_key", String(64))]:
+        if column in {c["name"] for c in inspect(connection).get_columns(table)}:
+            continue
+        connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {type_.compile(dialect=connection.dialect)}"))
+        if column == "updated_at":
+            connection.execute(text(f"UPDATE {table} SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL"))
+    # 旧表上的唯一约束以同名唯一索引补上；equipment.usage_years 已改为计算属性，旧列保留不删
+    inspector = inspect(connection)
+    for table, name, columns in [("invoice", "uq_invoice_owner_charge_period", "owner_id, charge_type_id, period"),
+                                 ("payment", "uq_payment_idempotency_key", "idempotency_key")]:
+        if name not in _existing_indexes(inspector, table):
+            connection.execute(text(f"CREATE UNIQUE INDEX {name} ON {table} ({columns})"))
+
+# (表, 索引名, 列)
+_V3_INDEXES = [
+    ("owner", "ix_owner_unit", "unit"),
+    ("owner", "ix_owner_created_at", "created_at"),
+    ("invoice", "ix_invoice_status_due_date", "status, due_date"),
+    ("invoice", "ix_invoice_due_date", "due_date, id"),
+    ("invoice", "ix_invoice_owner_due_date", "owner_id, due_date, id"),
+    ("invoice", "ix_invoice_updated_at", "updated_at, id"),
+    ("payment", "ix_payment_invoice_id", "invoice_id"),
+    ("payment", "ix_payment_owner_paid_at", "owner_id, paid_at"),
+    ("payment", "ix_payment_paid_at", "paid_at, id"),
+    ("maintenance_plan", "ix_maintenance_plan_next_date", "next_date"),
+    ("maintenance_plan", "ix_maintenance_plan_equipment_id", "equipment_id"),
+    ("work_order", "ix_work_order_status_created_at", "status, created_at, id"),
+    ("work_order", "ix_work_order_created_at", "created_at, id"),
+    ("work_order", "ix_work_order_owner_created_at", "owner_id, created_at"),
+    ("work_order", "ix_work_order_equipment_id", "equipment_id"),
+    ("work_order", "ix_work_order_updated_at", "updated_at, id"),
+    ("maintenance_record", "ix_maintenance_record_equipment_date", "equipment_id, repair_date"),
+    ("announcement", "ix_announcement_created_at", "created_at, id"),
+]
+
+def create_indexes(connection):
+    """原有表上的列表、详情、导出查询索引"""
+    inspector = inspect(connection)
+    existing = {}
+    for table, name, columns in _V3_INDEXES:
+        if table not in existing:
+            existing[table] = _existing_indexes(inspector, table)
+        if name not in existing[table]:
+            connection.execute(text(f"CREATE INDEX {name} ON {table} ({columns})"))
+
+def create_period_summary(connection):
+    period_summary.create(connection, checkfirst=True)
+
+_v5 = MetaData()
+_v5_owner = Table("owner", _v5, Column("id", Integer, primary_key=True), Column("unit", String(120)))
+_v5_unique_unit = Index("uq_owner_unit", _v5_owner.c.unit, unique=True)
+_v5_old_unit = Index("ix_owner_unit", _v5_owner.c.unit)
+
+def unique_owner_unit(connection):
+    """房号唯一，导入按房号 upsert；已有重复房号时中止，合并后再升级"""
+    connection.execute(text("UPDATE owner SET unit = NULL WHERE trim(unit) = ''"))
+    duplicates = connection.execute(text(
+        "SELECT unit FROM owner WHERE unit IS NOT NULL GROUP BY unit HAVING COUNT(*) > 1 ORDER BY unit")).scalars().all()
+    if duplicates:
+        raise RuntimeError(f"{len(duplicates)} 个房产登记了多位业主，请先合并：" + "、".join(duplicates[:20]))
+    existing = _existing_indexes(inspect(connection), "owner")
+    if "uq_owner_unit" not in existing:
+        _v5_unique_unit.create(connection)
+    if "ix_owner_unit" in existing:
+        _v5_old_unit.drop(connection)
+
+def add_plan_anchor(connection):
+    """保养计划的排程起点；已推进过的计划只能以当前 next_date 为起点"""
+    if "anchor_date" not in {c["name"] for c in inspect(connection).get_columns("maintenance_plan")}:
+        connection.execute(text(f"ALTER TABLE maintenance_plan ADD COLUMN anchor_date {Date().compile(dialect=connection.dialect)}"))
+    connection.execute(text("UPDATE maintenance_plan SET anchor_date = next_date WHERE anchor_date IS NULL"))
+
+# (版本, 说明, 函数)；只能追加，不要修改已发布的步骤；每步只用本文件里冻结的表结构，不引用模型
+MIGRATIONS = [
+    (1, "create tables added since v-1.2", create_tables),
+    (2, "add invoice/payment/work_order columns", add_columns),
+    (3, "composite indexes for list, detail and export queries", create_indexes),
+    (4, "period_summary table for collection reports", create_period_summary),
+    (5, "unique owner.unit for import upserts", unique_owner_unit),
+    (6, "maintenance_plan.anchor_date for month-end schedules", add_plan_anchor),
+]
+
+def current_version(connection):
+    if not inspect(connection).has_table("schema_version"):
+        return 0
+    return connection.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+def upgrade():
+    """依次执行未执行的迁移，每个版本一个事务；返回执行过的 [(版本, 说明)]"""
+    applied = []
+    with db.engine.begin() as connection:
+        schema_version.create(connection, checkfirst=True)
+        version = current_version(connection)
+    for number, name, step in MIGRATIONS:
+        if number <= version:
+            continue
+        with db.engine.begin() as connection:
+            step(connection)
+            connection.execute(schema_version.insert().values(version=number, name=name, applied_at=datetime.utcnow()))
+        applied.append((number, name))
+    return applied
+
+def stamp():
+    """init-db 按当前模型建好全部表后，把所有迁移记为已执行"""
+    with db.engine.begin() as connection:
+        connection.execute(schema_version.delete())
+        connection.execute(schema_version.insert(), [
+            {"version": number, "name": name, "applied_at": datetime.utcnow()} for number, name, _ in MIGRATIONS
+        ])
@@ -1,7 +1,30 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, date
+from sqlalchemy import Float
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.sql.functions import FunctionElement
+from database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+class days_since(FunctionElement):
+    """SQL 表达式：从某个日期到今天的天数"""
+    type = Float()
+    inherit_cache = True
+    name = "days_since"
+
+@compiles(days_since)
+def _days_since_default(element, compiler, **kw):
+    return "(CURRENT_DATE - %s)" % compiler.process(element.clauses, **kw)
+
+@compiles(days_since, "sqlite")
+def _days_since_sqlite(element, compiler, **kw):
+    return "(julianday('now', 'localtime', 'start of day') - julianday(%s))" % compiler.process(element.clauses, **kw)
+
+@compiles(days_since, "mysql")
+def _days_since_mysql(element, compiler, **kw):
+    return "DATEDIFF(CURRENT_DATE, %s)" % compiler.process(element.clauses, **kw)
 
 class Owner(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -11,14 +34,58 @@ class Owner(db.Model):
     unit = db.Column(db.String(120))   # 房产信息（楼栋/单元/门牌）
     area = db.Column(db.Float)   # 房屋面积（平方米）
     unit_type = db.Column(db.String(50))   # 房型（一室一厅、两室一厅等）
-    vehicles = db.Column(db.Text)   # JSON: [{"plate":"沪A12345","model":"Tesla 3"}]
-    vehicle_count = db.Column(db.Integer, default=0)   # 车辆数量
-    parking_spots = db.Column(db.String(255))   # 车位编号，多个用逗号分隔
+    vehicles = db.Column(db.Text)   # JSON: [{"plate":"沪A12345","model":"Tesla 3"}]，表单录入格式，同步到 Vehicle 表
+    vehicle_count = db.Column(db.Integer, default=0)   # 车辆数量，由 Vehicle 表统计
+    parking_spots = db.Column(db.String(255))   # 车位编号，多个用逗号分隔，同步到 ParkingSpot 表
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     invoices = db.relationship('Invoice', backref='owner', lazy=True)
     payments = db.relationship('Payment', backref='owner', lazy=True)
     workorders = db.relationship('WorkOrder', backref='requester', lazy=True)
+    account = db.relationship('OwnerAccount', uselist=False, cascade='all, delete-orphan', lazy=True)
+    vehicle_records = db.relationship('Vehicle', backref='owner', cascade='all, delete-orphan', lazy=True)
+    parking_spot_records = db.relationship('ParkingSpot', backref='owner', cascade='all, delete-orphan', lazy=True)
+
+    __table_args__ = (
+        db.Index('uq_owner_unit', 'unit', unique=True),   # 一个房号一位业主，导入时按房号 upsert
+        db.Index('ix_owner_created_at', 'created_at'),
+    )
+
+    @property
+    def balance(self):
+        """欠费金额（来自账户汇总），没有账户记录视为 0"""
+        return self.account.balance if self.account else 0.0
+
+class OwnerAccount(db.Model):
+    """业主账户汇总，随账单、缴费写入在同一事务内增量维护"""
+    owner_id = db.Column(db.Integer, db.ForeignKey('owner.id'), primary_key=True)
+    total_billed = db.Column(db.Float, nullable=False, default=0.0)   # 累计应缴
+    total_paid = db.Column(db.Float, nullable=False, default=0.0)   # 累计已缴
+    balance = db.Column(db.Float, nullable=False, default=0.0)   # 欠费 = 累计应缴 - 累计已缴，负数为预存
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_owner_account_balance', 'balance', 'owner_id'),   # 按欠费排序
+    )
+
+class Vehicle(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    owner_id = db.Column(db.Integer, db.ForeignKey('owner.id'), nullable=False, index=True)
+    plate = db.Column(db.String(20), nullable=False)   # 车牌，去掉空格和分隔符后大写
+    model = db.Column(db.String(120))
+
+    __table_args__ = (
+        db.UniqueConstraint('plate', name='uq_vehicle_plate'),
+    )
+
+class ParkingSpot(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    owner_id = db.Column(db.Integer, db.ForeignKey('owner.id'), nullable=False, index=True)
+    spot_number = db.Column(db.String(20), nullable=False)   # 车位编号，如 P-004
+
+    __table_args__ = (
+        db.UniqueConstraint('spot_number', name='uq_parking_spot_number'),
+    )
 
 class ChargeType(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -41,9 +108,34 @@ class Invoice(db.Model):
     due_date = db.Column(db.Date, nullable=False)
     status = db.Column(db.String(30), default="未支付")   # 未支付/已支付/逾期
     description = db.Column(db.String(255))
+    period = db.Column(db.String(7))   # 批量生成的账期（YYYY-MM），手工账单为空
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)   # 行版本，API 增量同步用
 
     charge_type = db.relationship('ChargeType')
 
+    __table_args__ = (
+        db.UniqueConstraint('owner_id', 'charge_type_id', 'period', name='uq_invoice_owner_charge_period'),
+        db.Index('ix_invoice_status_due_date', 'status', 'due_date'),   # 逾期扫描与状态筛选
+        db.Index('ix_invoice_due_date', 'due_date', 'id'),   # 账单列表分页、按到期日导出
+        db.Index('ix_invoice_owner_due_date', 'owner_id', 'due_date', 'id'),   # 业主详情、按业主筛选
+        db.Index('ix_invoice_updated_at', 'updated_at', 'id'),
+    )
+
+class PeriodSummary(db.Model):
+    """按月份、收费项目、楼栋汇总的应收/实收，随账单、缴费写入增量维护"""
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(7), nullable=False)   # YYYY-MM：账单取账期（手工账单取到期月），缴费取缴费月
+    charge_type_id = db.Column(db.Integer, nullable=False, default=0)   # 0：手工账单无收费项目，或缴费未关联账单
+    building = db.Column(db.String(20), nullable=False, default="")   # 楼栋，由 Owner.unit 解析（A-2-302 -> A）
+    billed = db.Column(db.Float, default=0.0)   # 应收
+    collected = db.Column(db.Float, default=0.0)   # 实收
+    invoices = db.Column(db.Integer, default=0)
+    payments = db.Column(db.Integer, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('period', 'charge_type_id', 'building', name='uq_period_summary_key'),
+    )
+
 class Payment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     owner_id = db.Column(db.Integer, db.ForeignKey('owner.id'), nullable=False)
@@ -52,9 +144,17 @@ class Payment(db.Model):
     method = db.Column(db.String(30), default="线上")
     paid_at = db.Column(db.DateTime, default=datetime.utcnow)
     note = db.Column(db.String(255))
+    idempotency_key = db.Column(db.String(64))   # 客户端幂等键，重复提交只记一次
 
     invoice = db.relationship('Invoice')
 
+    __table_args__ = (
+        db.UniqueConstraint('idempotency_key', name='uq_payment_idempotency_key'),
+        db.Index('ix_payment_invoice_id', 'invoice_id'),   # 按账单汇总已缴金额
+        db.Index('ix_payment_owner_paid_at', 'owner_id', 'paid_at'),
+        db.Index('ix_payment_paid_at', 'paid_at', 'id'),   # 缴费列表分页、按日期导出
+    )
+
 class Equipment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
@@ -64,19 +164,35 @@ class Equipment(db.Model):
     serial = db.Column(db.String(120))
     status = db.Column(db.String(50), default="正常")   # 正常/维护/停用
     install_date = db.Column(db.Date)
-    usage_years = db.Column(db.Float)   # 设备使用时间（年）
 
     plans = db.relationship('MaintenancePlan', backref='equipment', lazy=True)
     workorders = db.relationship('WorkOrder', backref='equipment', lazy=True)
     maintenance_records = db.relationship('MaintenanceRecord', backref='equipment', lazy=True)
 
+    @hybrid_property
+    def usage_years(self):
+        """设备使用时间（年），由安装日期实时计算"""
+        if self.install_date is None:
+            return None
+        return (date.today() - self.install_date).days / 365.25
+
+    @usage_years.expression
+    def usage_years(cls):
+        return days_since(cls.install_date) / 365.25
+
 class MaintenancePlan(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     equipment_id = db.Column(db.Integer, db.ForeignKey('equipment.id'), nullable=False)
     frequency = db.Column(db.String(50), default="每季度")
     next_date = db.Column(db.Date)
+    anchor_date = db.Column(db.Date)   # 排程起点：第 n 次 = anchor_date + 周期 × n，月末计划不会逐月漂移；为空时取 next_date
     notes = db.Column(db.String(255))
 
+    __table_args__ = (
+        db.Index('ix_maintenance_plan_next_date', 'next_date'),   # 到期计划扫描
+        db.Index('ix_maintenance_plan_equipment_id', 'equipment_id'),
+    )
+
 class WorkOrder(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     type = db.Column(db.String(50), default="维修")   # 维修/投诉/保洁/其他
@@ -90,10 +206,36 @@ class WorkOrder(db.Model):
     assignee = db.Column(db.String(120))   # 负责人
     repairer = db.Column(db.String(120))   # 维修人
     satisfaction = db.Column(db.String(20))   # 是否满意：满意/不满意/未评价
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)   # 行版本，API 增量同步用
 
     owner_id = db.Column(db.Integer, db.ForeignKey('owner.id'))
     equipment_id = db.Column(db.Integer, db.ForeignKey('equipment.id'))
 
+    __table_args__ = (
+        db.Index('ix_work_order_status_created_at', 'status', 'created_at', 'id'),   # 按状态筛选的列表
+        db.Index('ix_work_order_created_at', 'created_at', 'id'),   # 工单列表分页、按日期导出
+        db.Index('ix_work_order_owner_created_at', 'owner_id', 'created_at'),
+        db.Index('ix_work_order_equipment_id', 'equipment_id'),
+        db.Index('ix_work_order_updated_at', 'updated_at', 'id'),
+    )
+
+class WorkOrderSlaDaily(db.Model):
+    """已完成工单按完成日期、维修人、类型、优先级的日汇总，随工单写入增量维护"""
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)   # 完成日期
+    repairer = db.Column(db.String(120), nullable=False, default="")
+    type = db.Column(db.String(50), nullable=False, default="")
+    priority = db.Column(db.String(20), nullable=False, default="")
+    completed = db.Column(db.Integer, default=0)   # 完成工单数
+    satisfied = db.Column(db.Integer, default=0)
+    dissatisfied = db.Column(db.Integer, default=0)
+    response_hist = db.Column(db.Text)   # 响应时长（小时）分桶计数，JSON 列表，桶边界见 analytics.SLA_BUCKETS
+    resolution_hist = db.Column(db.Text)   # 解决时长（小时）分桶计数
+
+    __table_args__ = (
+        db.UniqueConstraint('day', 'repairer', 'type', 'priority', name='uq_work_order_sla_daily_key'),
+    )
+
 class MaintenanceRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     equipment_id = db.Column(db.Integer, db.ForeignKey('equipment.id'), nullable=False)
@@ -105,9 +247,52 @@ class MaintenanceRecord(db.Model):
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_maintenance_record_equipment_date', 'equipment_id', 'repair_date'),
+    )
+
+class EquipmentCostRollup(db.Model):
+    """按设备、年份汇总的维修记录，随 MaintenanceRecord 写入增量维护"""
+    id = db.Column(db.Integer, primary_key=True)
+    equipment_id = db.Column(db.Integer, db.ForeignKey('equipment.id'), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    repairs = db.Column(db.Integer, default=0)   # 维修次数
+    replacements = db.Column(db.Integer, default=0)   # 更换次数
+    total_cost = db.Column(db.Float, default=0.0)   # 维修费用合计
+
+    __table_args__ = (
+        db.UniqueConstraint('equipment_id', 'year', name='uq_equipment_cost_rollup_equipment_year'),
+    )
+
 class Announcement(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     send_email = db.Column(db.Boolean, default=False)
+
+    __table_args__ = (
+        db.Index('ix_announcement_created_at', 'created_at', 'id'),
+    )
+
+class EmailOutbox(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    announcement_id = db.Column(db.Integer, db.ForeignKey('announcement.id'), nullable=False)
+    owner_id = db.Column(db.Integer, db.ForeignKey('owner.id'))
+    email = db.Column(db.String(120), nullable=False)
+    status = db.Column(db.String(20), default="待发送")   # 待发送/发送中/已发送/失败
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.String(255))
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)   # 重试退避
+    claim_token = db.Column(db.String(32))   # 领取该行的发送批次
+    claimed_at = db.Column(db.DateTime)
+    sent_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    announcement = db.relationship('Announcement')
+
+    __table_args__ = (
+        db.UniqueConstraint('announcement_id', 'email', name='uq_email_outbox_announcement_email'),
+        db.Index('ix_email_outbox_status_next', 'status', 'next_attempt_at'),
+        db.Index('ix_email_outbox_claim_token', 'claim_token'),
+    )
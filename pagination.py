@@ -0,0 +1,153 @@
+import base64
+import json
+from datetime import datetime, date
+from flask import request, current_app, url_for
+from sqlalchemy import and_, false, or_
+
+class Page:
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+def _encode(values):
+    raw = json.dumps([v.isoformat() if isinstance(v, (datetime, date)) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def _decode(cursor, columns):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        return None
+    if not isinstance(values, list) or len(values) != len(columns):
+        return None
+    decoded = []
+    for col, v in zip(columns, values):
+        # 按列类型还原游标值
+        py_type = col.type.python_type
+        try:
+            if v is None:
+                decoded.append(None)
+            elif py_type is datetime:
+                decoded.append(datetime.fromisoformat(v))
+            elif py_type is date:
+                decoded.append(date.fromisoformat(v))
+            else:
+                decoded.append(py_type(v))
+        except (TypeError, ValueError):
+            return None
+    return decoded
+
+def _nullable(col):
+    return getattr(getattr(col, 'expression', col), 'nullable', True)
+
+def _after(col, value, desc, nulls_high, nullable):
+    """排序上严格位于 value 之后；可为空的列按 nulls_high 把 NULL 视为最大或最小"""
+    cmp = (col < value if desc else col > value) if value is not None else None
+    if not nullable:
+        return cmp
+    if nulls_high != desc:
+        # NULL 排在末尾：NULL 之后没有行，其他值之后还有全部 NULL
+        return false() if value is None else or_(cmp, col.is_(None))
+    return col.isnot(None) if value is None else cmp
+
+def _seek(columns, values, desc, nulls_high=False, lead_not_null=False):
+    """(a, b) > (x, y) 展开为 a >= x AND (a > x OR (a = x AND b > y))，可以按复合索引范围读取；
+    值为 NULL 时 a = x 即 a IS NULL。lead_not_null：调用方已限定首列非空"""
+    if not columns:
+        return false()
+    clauses = []
+    for i, col in enumerate(columns):
+        nullable = _nullable(col) and not (i == 0 and lead_not_null)
+        clauses.append(and_(*[columns[j] == values[j] for j in range(i)], _after(col, values[i], desc, nulls_high, nullable)))
+    lead, value = columns[0], values[0]
+    if value is not None and (lead_not_null or not _nullable(lead)):
+        # 首列的冗余范围条件：OR 展开式本身不能走索引范围（SQLite 会扫描整个索引）
+        return and_(lead <= value if desc else lead >= value, or_(*clauses))
+    return or_(*clauses)
+
+def _order(col, desc, nulls_high, dialect):
+    ordered = col.desc() if desc else col.asc()
+    if not _nullable(col) or dialect == 'mysql':
+        return ordered   # MySQL 不支持 NULLS FIRST/LAST，默认 NULL 最小
+    return ordered.nulls_last() if nulls_high != desc else ordered.nulls_first()
+
+def _fetch(query, columns, values, desc, limit):
+    """按排序键取游标之后的 limit 行。NULL 按数据库默认规则排序（PostgreSQL 最大，SQLite、MySQL 最小），
+    首列可为空时把 NULL 与非 NULL 分两段查询，每段都是索引上的范围读取，不会因 OR ... IS NULL 退化为扫描"""
+    dialect = query.session.get_bind().dialect.name
+    nulls_high = dialect not in ('sqlite', 'mysql')
+    order = [_order(c, desc, nulls_high, dialect) for c in columns]
+    lead = columns[0]
+    if not _nullable(lead):
+        if values is not None:
+            query = query.filter(_seek(columns, values, desc, nulls_high))
+        return query.order_by(*order).limit(limit).all()
+
+    segments = [False, True] if nulls_high != desc else [True, False]   # 按遍历顺序，各段是否为 NULL 段
+    if values is not None:
+        segments = segments[segments.index(values[0] is None):]   # 跳过游标之前的段
+    rows = []
+    for is_null in segments:
+        part = query.filter(lead.is_(None) if is_null else lead.isnot(None))
+        if values is not None and (values[0] is None) == is_null:
+            if is_null:
+                part = part.filter(_seek(columns[1:], values[1:], desc, nulls_high))
+            else:
+                part = part.filter(_seek(columns, values, desc, nulls_high, lead_not_null=True))
+        rows += part.order_by(*order).limit(limit - len(rows)).all()
+        if len(rows) >= limit:
+            break
+    return rows
+
+def per_page_arg():
+    default = current_app.config.get('PAGE_SIZE', 50)
+    sizes = current_app.config.get('PAGE_SIZES', [default])
+    per_page = request.args.get('per_page', default, type=int)
+    return per_page if per_page in sizes else default
+
+def keyset_paginate(query, columns, desc=False, per_page=None):
+    """按排序键分页，游标取自 ?after= / ?before= 参数"""
+    per_page = per_page or per_page_arg()
+    after = request.args.get('after')
+    before = request.args.get('before')
+    cursor = after or before
+    values = _decode(cursor, columns) if cursor else None
+    backwards = bool(before) and values is not None
+
+    rows = _fetch(query, columns, values, desc != backwards, per_page + 1)
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    def key(row):
+        return _encode([getattr(row, c.key) for c in columns])
+
+    next_cursor = prev_cursor = None
+    if rows:
+        # 向后翻页时，本页之后必然还有数据；反之亦然
+        if more or backwards:
+            next_cursor = key(rows[-1])
+        if (more and backwards) or (values is not None and not backwards):
+            prev_cursor = key(rows[0])
+    return Page(rows, per_page, next_cursor, prev_cursor)
+
+def page_url(**changes):
+    """保留当前筛选条件，替换分页参数"""
+    args = request.args.to_dict()
+    for k in ('after', 'before'):
+        args.pop(k, None)
+    args.update({k: v for k, v in changes.items() if v is not None})
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
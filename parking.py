@@ -0,0 +1,104 @@
+import json
+import re
+from sqlalchemy import func, insert, select, update
+from models import db, Owner, Vehicle, ParkingSpot
+
+BATCH = 1000
+_PLATE_SEPARATORS = re.compile(r"[\s·.\-]+")
+
+def normalize_plate(plate):
+    """'沪A·12345' / '沪a 12345' -> '沪A12345'"""
+    return _PLATE_SEPARATORS.sub("", str(plate or "")).upper()
+
+def normalize_spot(spot):
+    return str(spot or "").strip().upper()
+
+def parse_vehicles(text):
+    """Owner.vehicles 的 JSON -> [(车牌, 车型)]，格式错误抛 ValueError"""
+    try:
+        parsed = json.loads(text or "[]")
+    except ValueError:
+        parsed = None
+    if not isinstance(parsed, list) or not all(isinstance(v, dict) for v in parsed):
+        raise ValueError("车辆详情应为 JSON 列表，如 [{\"plate\":\"沪A12345\",\"model\":\"Tesla 3\"}]")
+    return [(normalize_plate(v.get("plate")), v.get("model") or None) for v in parsed if normalize_plate(v.get("plate"))]
+
+def parse_spots(text):
+    """'P-001, P-002；P-003' -> ['P-001', 'P-002', 'P-003']"""
+    return [normalize_spot(s) for s in re.split(r"[,，;；]", text or "") if s.strip()]
+
+def sync_owners(owner_ids):
+    """按业主的车辆 JSON、车位字符串重建 Vehicle / ParkingSpot 行并更新 vehicle_count；
+    不提交事务，返回 {"vehicles": n, "spots": n, "conflicts": [(业主 ID, 车牌/车位)], "invalid": [业主 ID]}"""
+    stats = {"vehicles": 0, "spots": 0, "conflicts": [], "invalid": []}
+    owner_ids = list(owner_ids)
+    for start in range(0, len(owner_ids), BATCH):
+        chunk = owner_ids[start:start + BATCH]
+        rows = db.session.query(Owner.id, Owner.vehicles, Owner.parking_spots).filter(Owner.id.in_(chunk)).order_by(Owner.id)
+        vehicles, spots = {}, {}
+        for owner_id, vehicles_json, spots_text in rows:
+            try:
+                parsed = parse_vehicles(vehicles_json)
+            except ValueError:
+                stats["invalid"].append(owner_id)
+                parsed = []
+            # 同一车牌/车位出现多次时，保留 ID 较小的业主
+            for plate, model in parsed:
+                if plate in vehicles:
+                    stats["conflicts"].append((owner_id, plate))
+                else:
+                    vehicles[plate] = dict(owner_id=owner_id, plate=plate, model=model)
+            for spot in parse_spots(spots_text):
+                if spot in spots:
+                    stats["conflicts"].append((owner_id, spot))
+                else:
+                    spots[spot] = dict(owner_id=owner_id, spot_number=spot)
+
+        db.session.execute(Vehicle.__table__.delete().where(Vehicle.owner_id.in_(chunk)))
+        db.session.execute(ParkingSpot.__table__.delete().where(ParkingSpot.owner_id.in_(chunk)))
+        # 已登记在本批以外业主名下的车牌/车位不覆盖
+        for model, key, pending in ((Vehicle, Vehicle.plate, vehicles), (ParkingSpot, ParkingSpot.spot_number, spots)):
+            taken = set()
+            keys = list(pending)
+            for i in range(0, len(keys), BATCH):
+                taken.update(k for (k,) in db.session.query(key).filter(key.in_(keys[i:i + BATCH])))
+            for k in taken:
+                stats["conflicts"].append((pending.pop(k)["owner_id"], k))
+            if pending:
+                db.session.execute(insert(model), list(pending.values()))
+        stats["vehicles"] += len(vehicles)
+        stats["spots"] += len(spots)
+
+        count = select(func.count(Vehicle.id)).where(Vehicle.owner_id == Owner.id).scalar_subquery()
+        db.session.execute(update(Owner).where(Owner.id.in_(chunk)).values(vehicle_count=count)
+                           .execution_options(synchronize_session=False))
+    return stats
+
+def migrate_all():
+    """把所有业主已有的车辆 JSON、车位字符串批量转换到新表，可重复执行"""
+    db.create_all()   # 只创建缺少的表
+    ids = [i for (i,) in db.session.query(Owner.id).order_by(Owner.id)]
+    stats = sync_owners(ids)
+    db.session.commit()
+    stats["owners"] = len(ids)
+    return stats
+
+def lookup(plate=None, spot=None):
+    """门岗查询：按车牌或车位编号精确查找，走唯一索引；未找到返回 None"""
+    if plate:
+        row = db.session.query(Vehicle).filter_by(plate=normalize_plate(plate)).first()
+        match = "plate"
+    elif spot:
+        row = db.session.query(ParkingSpot).filter_by(spot_number=normalize_spot(spot)).first()
+        match = "spot"
+    else:
+        return None
+    if row is None:
+        return None
+    owner = row.owner
+    return {
+        "match": match,
+        "owner": {"id": owner.id, "name": owner.name, "unit": owner.unit, "phone": owner.phone},
+        "vehicles": [{"plate": v.plate, "model": v.model} for v in owner.vehicle_records],
+        "parking_spots": [s.spot_number for s in owner.parking_spot_records],
+    }
@@ -0,0 +1,47 @@
+from contextlib import contextmanager
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+class StatementBudgetExceeded(RuntimeError):
+    pass
+
+# record_statements() 打开的收集列表
+_recorders = []
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.sql_statements = g.get('sql_statements', 0) + 1
+    for recorded in _recorders:
+        recorded.append((statement, parameters, executemany))
+
+def _listen():
+    if not event.contains(Engine, 'before_cursor_execute', _count_statement):
+        event.listen(Engine, 'before_cursor_execute', _count_statement)
+
+@contextmanager
+def record_statements():
+    """收集期间执行的 SQL：[(语句, 参数, 是否 executemany)]，与请求预算用同一个计数点；供压测、EXPLAIN 检查使用"""
+    _listen()
+    recorded = []
+    _recorders.append(recorded)
+    try:
+        yield recorded
+    finally:
+        _recorders.remove(recorded)
+
+def init_app(app):
+    """统计每个请求执行的 SQL 条数；设置 SQL_STATEMENT_BUDGET 后超出即报错"""
+    _listen()
+
+    @app.after_request
+    def check_statement_budget(response):
+        budget = app.config.get('SQL_STATEMENT_BUDGET')
+        count = g.get('sql_statements', 0)
+        if budget and count > budget:
+            msg = f"{request.method} {request.path} 执行了 {count} 条 SQL，超出预算 {budget}"
+            # 测试模式下直接失败，用于发现 N+1 回归
+            if app.testing:
+                raise StatementBudgetExceeded(msg)
+            app.logger.warning(msg)
+        return response
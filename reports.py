@@ -0,0 +1,176 @@
+from datetime import date
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import String, event, func, insert, literal_column, select, update
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from database import upsert_add
+from models import db, ChargeType, Invoice, Owner, Payment, PeriodSummary
+
+BATCH = 2000
+REPORT_DIMENSIONS = {"charge_type": PeriodSummary.charge_type_id, "building": PeriodSummary.building}
+_COUNTERS = ("billed", "collected", "invoices", "payments")
+
+class building_of(FunctionElement):
+    """SQL 表达式：房号第一个 '-' 之前的部分作为楼栋，A-2-302 -> A；没有 '-' 为空串"""
+    type = String()
+    inherit_cache = True
+    name = "building_of"
+
+@compiles(building_of)
+def _building_of_default(element, compiler, **kw):
+    unit = compiler.process(element.clauses, **kw)
+    return f"(CASE WHEN strpos({unit}, '-') > 1 THEN left(upper(trim(split_part({unit}, '-', 1))), 20) ELSE '' END)"
+
+@compiles(building_of, "sqlite")
+def _building_of_sqlite(element, compiler, **kw):
+    unit = compiler.process(element.clauses, **kw)
+    return f"(CASE WHEN instr({unit}, '-') > 1 THEN substr(upper(trim(substr({unit}, 1, instr({unit}, '-') - 1))), 1, 20) ELSE '' END)"
+
+@compiles(building_of, "mysql")
+def _building_of_mysql(element, compiler, **kw):
+    unit = compiler.process(element.clauses, **kw)
+    return f"(CASE WHEN LOCATE('-', {unit}) > 1 THEN LEFT(UPPER(TRIM(SUBSTRING_INDEX({unit}, '-', 1))), 20) ELSE '' END)"
+
+class year_month(FunctionElement):
+    """SQL 表达式：日期所在月份 YYYY-MM"""
+    type = String()
+    inherit_cache = True
+    name = "year_month"
+
+@compiles(year_month)
+def _year_month_default(element, compiler, **kw):
+    return "to_char(%s, 'YYYY-MM')" % compiler.process(element.clauses, **kw)
+
+@compiles(year_month, "sqlite")
+def _year_month_sqlite(element, compiler, **kw):
+    return "strftime('%%Y-%%m', %s)" % compiler.process(element.clauses, **kw)
+
+@compiles(year_month, "mysql")
+def _year_month_mysql(element, compiler, **kw):
+    return "DATE_FORMAT(%s, '%%%%Y-%%%%m')" % compiler.process(element.clauses, **kw)
+
+# 汇总键的 SQL 表达式，全量重建与批量出账共用；常量内联，避免 GROUP BY 里出现不同的绑定参数
+_INVOICE_PERIOD = func.coalesce(Invoice.period, year_month(Invoice.due_date))
+_CHARGE_TYPE = func.coalesce(Invoice.charge_type_id, literal_column("0"))
+_BUILDING = building_of(Owner.unit)
+
+def _apply(connection, key, delta, sign):
+    """在当前事务内累加一个 (账期, 收费项目, 楼栋) 行"""
+    period, charge_type_id, building = key
+    table = PeriodSummary.__table__
+    delta = {k: sign * v for k, v in delta.items()}
+    where = (table.c.period == period, table.c.charge_type_id == charge_type_id, table.c.building == building)
+    if sign < 0:
+        connection.execute(update(table).where(*where).values({k: table.c[k] + v for k, v in delta.items()}))
+        # 已没有账单和缴费时删除，与全量重建结果一致
+        connection.execute(table.delete().where(*where, table.c.invoices <= 0, table.c.payments <= 0))
+        return
+    upsert_add(connection, table, {"period": period, "charge_type_id": charge_type_id, "building": building},
+               dict(dict.fromkeys(_COUNTERS, 0), **delta))
+
+def _building(connection, owner_id):
+    return connection.execute(select(_BUILDING).where(Owner.id == owner_id)).scalar() or ""
+
+def _invoice_key(connection, target):
+    period = target.period or target.due_date.strftime("%Y-%m")
+    return period, target.charge_type_id or 0, _building(connection, target.owner_id)
+
+def _payment_key(connection, target):
+    charge_type_id = None
+    if target.invoice_id:
+        charge_type_id = connection.execute(select(Invoice.charge_type_id).where(Invoice.id == target.invoice_id)).scalar()
+    return target.paid_at.strftime("%Y-%m"), charge_type_id or 0, _building(connection, target.owner_id)
+
+@event.listens_for(Invoice, "after_insert")
+def _invoice_inserted(mapper, connection, target):
+    _apply(connection, _invoice_key(connection, target), {"billed": target.amount or 0.0, "invoices": 1}, 1)
+
+@event.listens_for(Invoice, "after_delete")
+def _invoice_deleted(mapper, connection, target):
+    _apply(connection, _invoice_key(connection, target), {"billed": target.amount or 0.0, "invoices": 1}, -1)
+
+@event.listens_for(Payment, "after_insert")
+def _payment_inserted(mapper, connection, target):
+    if target.paid_at is not None:
+        _apply(connection, _payment_key(connection, target), {"collected": target.amount or 0.0, "payments": 1}, 1)
+
+@event.listens_for(Payment, "after_delete")
+def _payment_deleted(mapper, connection, target):
+    if target.paid_at is not None:
+        _apply(connection, _payment_key(connection, target), {"collected": target.amount or 0.0, "payments": 1}, -1)
+
+def _invoice_totals(*criteria):
+    return (select(_INVOICE_PERIOD, _CHARGE_TYPE, _BUILDING, func.sum(Invoice.amount), func.count(Invoice.id))
+            .select_from(Invoice).outerjoin(Owner, Invoice.owner_id == Owner.id)
+            .where(*criteria)
+            .group_by(_INVOICE_PERIOD, _CHARGE_TYPE, _BUILDING))
+
+def post_period_billed(*criteria):
+    """INSERT ... SELECT 批量出账后调用：按汇总键合计满足条件的账单后计入，与出账同一事务"""
+    connection = db.session.connection()
+    for period, charge_type_id, building, billed, count in db.session.execute(_invoice_totals(*criteria)).all():
+        _apply(connection, (period, charge_type_id, building or ""), {"billed": billed or 0.0, "invoices": count}, 1)
+
+def rebuild_reports():
+    """从账单、缴费全量重建期间汇总，返回行数与重建前不一致的行数"""
+    rows = {}
+    for period, charge_type_id, building, billed, count in db.session.execute(_invoice_totals()):
+        row = rows.setdefault((period, charge_type_id, building or ""), dict.fromkeys(_COUNTERS, 0))
+        row["billed"] += billed or 0.0
+        row["invoices"] += count
+    paid_period = year_month(Payment.paid_at)
+    payments = (select(paid_period, _CHARGE_TYPE, _BUILDING, func.sum(Payment.amount), func.count(Payment.id))
+                .select_from(Payment)
+                .outerjoin(Invoice, Payment.invoice_id == Invoice.id)
+                .outerjoin(Owner, Payment.owner_id == Owner.id)
+                .where(Payment.paid_at.isnot(None))
+                .group_by(paid_period, _CHARGE_TYPE, _BUILDING))
+    for period, charge_type_id, building, collected, count in db.session.execute(payments):
+        row = rows.setdefault((period, charge_type_id, building or ""), dict.fromkeys(_COUNTERS, 0))
+        row["collected"] += collected or 0.0
+        row["payments"] += count
+
+    current = {(r.period, r.charge_type_id, r.building): r for r in db.session.query(PeriodSummary)}
+    mismatched = 0
+    for key, row in rows.items():
+        old = current.pop(key, None)
+        if old is None or any(round((getattr(old, k) or 0) - row[k], 2) for k in _COUNTERS):
+            mismatched += 1
+    mismatched += len(current)   # 汇总里有、明细里已没有的行
+    db.session.execute(PeriodSummary.__table__.delete())
+    records = [dict(row, period=period, charge_type_id=charge_type_id, building=building)
+               for (period, charge_type_id, building), row in rows.items()]
+    for start in range(0, len(records), BATCH):
+        db.session.execute(insert(PeriodSummary), records[start:start + BATCH])
+    db.session.commit()
+    return {"rows": len(records), "mismatched": mismatched}
+
+def collection_report(by=None, months=12, today=None):
+    """最近 months 个月按月（可再按收费项目或楼栋）汇总应收、实收、收缴率与月末累计欠费，只读汇总表"""
+    today = today or date.today()
+    start = (today.replace(day=1) - relativedelta(months=months - 1)).strftime("%Y-%m")
+    keys = [REPORT_DIMENSIONS[by]] if by else []
+    # 窗口之前的差额合计作为期初欠费
+    opening = (db.session.query(*keys, func.sum(PeriodSummary.billed - PeriodSummary.collected))
+               .filter(PeriodSummary.period < start).group_by(*keys))
+    balance = {tuple(row[:-1]): row[-1] for row in opening}
+    rows = (db.session.query(PeriodSummary.period, *keys, func.sum(PeriodSummary.billed), func.sum(PeriodSummary.collected),
+                             func.sum(PeriodSummary.invoices), func.sum(PeriodSummary.payments))
+            .filter(PeriodSummary.period >= start)
+            .group_by(PeriodSummary.period, *keys)
+            .order_by(PeriodSummary.period, *keys))
+    names = dict(db.session.query(ChargeType.id, ChargeType.name)) if by == "charge_type" else {}
+    report = []
+    for period, *key, billed, collected, invoices, payments in rows:
+        key = tuple(key)
+        billed, collected = billed or 0.0, collected or 0.0
+        balance[key] = (balance.get(key) or 0.0) + billed - collected
+        group = key[0] if key else None
+        report.append({
+            "period": period, "group": names.get(group) if by == "charge_type" else group,
+            "billed": billed, "collected": collected, "net": billed - collected, "outstanding": balance[key],
+            "invoices": int(invoices or 0), "payments": int(payments or 0),
+            "collection_rate": collected / billed if billed else None,
+        })
+    report.sort(key=lambda r: r["period"], reverse=True)
+    return report
@@ -0,0 +1,137 @@
+import re
+from sqlalchemy import text, column, and_, or_
+from models import db, Owner, Equipment
+
+# 可搜索字段：SQLite 用 FTS5 trigram 外部内容表（需 SQLite ≥ 3.34），PostgreSQL 用 pg_trgm GIN 索引；
+# 两者都按任意 3 字以上子串匹配，中文姓名、位置的一部分也能搜到
+SEARCH_FIELDS = {
+    Owner: ('name', 'phone', 'unit'),
+    Equipment: ('name', 'location', 'serial'),
+}
+
+# 建索引时加一，连接上缓存的检查结果随之失效
+_generation = 0
+
+def _dialect():
+    return db.engine.dialect.name
+
+def _fts_table(model):
+    return f"{model.__tablename__}_fts"
+
+def _sqlite_ddl(model):
+    table = model.__tablename__
+    fts = _fts_table(model)
+    fields = SEARCH_FIELDS[model]
+    cols = ", ".join(fields)
+    new = ", ".join(f"new.{f}" for f in fields)
+    old = ", ".join(f"old.{f}" for f in fields)
+    # 触发器保证任何写入路径（含批量 SQL）都同步到索引
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+    ]
+
+def _postgres_ddl(model):
+    table = model.__tablename__
+    return [
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_{f}_trgm ON {table} USING gin ({f} gin_trgm_ops)"
+        for f in SEARCH_FIELDS[model]
+    ]
+
+def create_search_index():
+    """建立搜索索引（可重复执行）"""
+    dialect = _dialect()
+    stale = []
+    if dialect == 'sqlite':
+        statements = []
+        with db.engine.begin() as conn:
+            for model in SEARCH_FIELDS:
+                fts = _fts_table(model)
+                ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                   {"name": fts}).scalar()
+                if ddl and "trigram" in ddl:
+                    continue
+                # 旧版按词切分的索引表（或还没有索引表）：重建为 trigram 后回填
+                if ddl:
+                    statements.append(f"DROP TABLE {fts}")
+                stale.append(fts)
+        statements += [s for model in SEARCH_FIELDS for s in _sqlite_ddl(model)]
+        statements += [f"INSERT INTO {fts}({fts}) VALUES ('rebuild')" for fts in stale]
+    elif dialect == 'postgresql':
+        statements = ["CREATE EXTENSION IF NOT EXISTS pg_trgm"]
+        statements += [s for model in SEARCH_FIELDS for s in _postgres_ddl(model)]
+    else:
+        return False
+    with db.engine.begin() as conn:
+        for stmt in statements:
+            conn.execute(text(stmt))
+    reset_search_cache()
+    return True
+
+def reset_search_cache():
+    """索引表建立或删除后调用，让各连接重新检查 FTS 表是否存在"""
+    global _generation
+    _generation += 1
+
+def rebuild_search_index():
+    """重建搜索索引，返回各表的记录数"""
+    create_search_index()
+    dialect = _dialect()
+    counts = {}
+    with db.engine.begin() as conn:
+        for model in SEARCH_FIELDS:
+            table = model.__tablename__
+            if dialect == 'sqlite':
+                fts = _fts_table(model)
+                conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+            elif dialect == 'postgresql':
+                for f in SEARCH_FIELDS[model]:
+                    conn.execute(text(f"REINDEX INDEX ix_{table}_{f}_trgm"))
+            counts[table] = conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+    return counts
+
+def _fts_available(model):
+    """每个数据库连接查一次 sqlite_master，结果记在连接上；换库、init-db 后的新连接会重新检查"""
+    if _dialect() != 'sqlite':
+        return False
+    conn = db.session.connection()
+    cached = conn.info.setdefault('search_fts', {})
+    if cached.get('generation') != _generation:
+        cached.clear()
+        cached['generation'] = _generation
+    fts = _fts_table(model)
+    if fts not in cached:
+        cached[fts] = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": fts}
+        ).first() is not None
+    return cached[fts]
+
+def _fts_query(terms):
+    """每个词做子串短语匹配：A-2-3 -> "A-2-3"，可匹配 A-2-302；电梯 匹配 1号电梯"""
+    return " ".join('"' + t.replace('"', '""') + '"' for t in terms)
+
+def search_filter(model, q):
+    """返回 model 的搜索条件；SQLite 未建索引或其他数据库退回 LIKE"""
+    fields = [getattr(model, f) for f in SEARCH_FIELDS[model]]
+    terms = [t for t in q.split() if re.search(r'\w', t)]
+    if terms and _fts_available(model):
+        # trigram 只能匹配 3 个字符以上的词，更短的词逐个用 LIKE
+        conditions = [or_(*[f.like(f"%{t}%") for f in fields]) for t in terms if len(t) < 3]
+        long_terms = [t for t in terms if len(t) >= 3]
+        if long_terms:
+            fts = _fts_table(model)
+            ids = (text(f"SELECT rowid FROM {fts} WHERE {fts} MATCH :fts_q")
+                   .bindparams(fts_q=_fts_query(long_terms)).columns(column('rowid')))
+            conditions.append(model.id.in_(ids))
+        return and_(*conditions)
+    if _dialect() == 'postgresql':
+        # ILIKE '%q%' 可以直接使用 gin_trgm_ops 索引
+        return or_(*[f.ilike(f"%{q}%") for f in fields])
+    like = f"%{q}%"
+    return or_(*[f.like(like) for f in fields])
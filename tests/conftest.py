@@ -0,0 +1,22 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    """临时 SQLite 库，建表后用 seed-bench 的数据填充；整个测试会话共用"""
+    os.environ["DATABASE_URL"] = "sqlite:///" + str(tmp_path_factory.mktemp("db") / "pm.db")
+    from app import app
+    import bench
+    import migrations
+    from models import db
+    from search import rebuild_search_index
+    app.config["TESTING"] = True
+    with app.app_context():
+        db.create_all()
+        migrations.stamp()
+        bench.seed(owners=300, months=12)
+        rebuild_search_index()
+    return app
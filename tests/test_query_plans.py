@@ -0,0 +1,25 @@
+import html
+import re
+import bench
+
+def test_routes_have_no_full_scans(app):
+    """每个页面的每条 SELECT 都要走索引；确需整表扫描的查询在 bench.FULL_SCAN_EXEMPT 里逐条登记"""
+    scans = bench.explain_routes(app)
+    assert not scans, "\n".join(f"{path}  全表扫描 {table}：{statement[:200]}" for path, table, statement in scans)
+
+def test_next_pages_have_no_full_scans(app):
+    """第二页带游标，seek 条件也要按索引范围读取"""
+    client = app.test_client()
+    paths = []
+    for path in ["/owners", "/billing/invoices", "/billing/payments", "/workorders", "/announcements",
+                 "/api/invoices", "/api/workorders", "/owners?sort=arrears", "/billing/invoices?status=未支付"]:
+        response = client.get(path + ("&" if "?" in path else "?") + "per_page=20")
+        cursor = response.get_json()["next_cursor"] if path.startswith("/api") else None
+        if cursor is None:
+            match = re.search(r'href="([^"#]*after=[^"]*)"', response.get_data(as_text=True))
+            assert match, f"{path} 没有下一页"
+            paths.append(html.unescape(match.group(1)))
+        else:
+            paths.append(f"{path}?per_page=20&after={cursor}")
+    scans = bench.explain_routes(app, paths)
+    assert not scans, "\n".join(f"{path}  全表扫描 {table}：{statement[:200]}" for path, table, statement in scans)
@@ -0,0 +1,23 @@
+import pytest
+import bench
+from querybudget import StatementBudgetExceeded
+
+# 列表每页 50 行，出现 N+1 时远超这个数
+BUDGET = 10
+
+def test_routes_stay_within_statement_budget(app, monkeypatch):
+    """逐个请求列表、详情页；TESTING 模式下超出 SQL_STATEMENT_BUDGET 会抛 StatementBudgetExceeded"""
+    monkeypatch.setitem(app.config, "SQL_STATEMENT_BUDGET", BUDGET)
+    client = app.test_client()
+    over = []
+    for path in bench._route_paths(app) + bench.EXPLAIN_PATHS:
+        try:
+            client.get(path)
+        except StatementBudgetExceeded as e:
+            over.append(str(e))
+    assert not over, "\n".join(over)
+
+def test_budget_is_enforced_under_testing(app, monkeypatch):
+    monkeypatch.setitem(app.config, "SQL_STATEMENT_BUDGET", 1)
+    with pytest.raises(StatementBudgetExceeded):
+        app.test_client().get("/owners/1")